@@ -0,0 +1,144 @@
+# bench.py -- offline micro/macro benchmarks for the calculator hot path.
+#
+#   python bench.py                       # run, compare with bench_baseline.json
+#   python bench.py --out results.json    # also write this run's numbers
+#   python bench.py --update-baseline     # accept this run as the new baseline
+#   python bench.py --threshold 0.10      # fail on >10% slowdowns (default 25%)
+import argparse, json, os, platform, statistics, subprocess, sys, tempfile, time
+
+# Keep benchmark rows out of the real history, but still pay for recording them.
+os.environ.setdefault("BODYFAT_HISTORY_DB", os.path.join(tempfile.mkdtemp(prefix="bodyfat-bench-"), "history.db"))
+import main
+
+METRIC_MALE = dict(subject="bench", sex="male", age="30", height_unit="cm", height_cm="180", weight_unit="kg", weight_val="80",
+                   neck_unit="cm", neck_val="38", waist_unit="cm", waist_val="85", hip_unit="cm", hip_val="")
+IMPERIAL_FEMALE = dict(subject="bench", sex="female", age="30", height_unit="ftin", height_ft="5", height_in="5", weight_unit="lb",
+                       weight_val="140", neck_unit="in", neck_val="13", waist_unit="in", waist_val="30",
+                       hip_unit="in", hip_val="38")
+MISSING_HIP = dict(IMPERIAL_FEMALE, hip_val="")
+HEIGHT_RANGE = dict(METRIC_MALE, height_cm="300")
+WAIST_LE_NECK = dict(METRIC_MALE, neck_val="45", waist_val="50")
+
+def _form(fields):
+    return {k: fields.get(k, "") for k in main.FORM_FIELDS}
+
+def cases():
+    client = main.app.test_client()
+    parse = main.SCHEMA.parse
+    rendered = main.render_page(parse(_form(METRIC_MALE)), result="16.15", show_weight=True)
+    assert "16.15" in rendered
+
+    yield "formula.male", lambda: main.navy_bodyfat_percent("male", 70.87, 14.96, 33.46)
+    yield "formula.female", lambda: main.navy_bodyfat_percent("female", 65.0, 13.0, 30.0, 38.0)
+
+    f_m, f_i, f_err = _form(METRIC_MALE), _form(IMPERIAL_FEMALE), _form(HEIGHT_RANGE)
+    yield "evaluate.metric", lambda: main.evaluate(parse(f_m))
+    yield "evaluate.imperial", lambda: main.evaluate(parse(f_i))
+    yield "evaluate.range_error", lambda: main.evaluate(parse(f_err))
+
+    m_m, m_err = parse(f_m), parse(f_err)
+    yield "render.result", lambda: main.render_page(m_m, result="16.15", show_weight=True)
+    yield "render.error", lambda: main.render_page(m_err, errors=[main.ERRORS["height_range"]])
+
+    yield "request.get", lambda: client.get("/")
+    yield "request.get_gzip", lambda: client.get("/", headers={"Accept-Encoding": "gzip"})
+    yield "request.get_304", lambda: client.get("/", headers={"If-None-Match": f'"{main.GET_PAGE.etag}"'})
+    for name, data in (("metric", METRIC_MALE), ("imperial", IMPERIAL_FEMALE), ("missing_hip", MISSING_HIP),
+                       ("range_error", HEIGHT_RANGE), ("formula_error", WAIST_LE_NECK)):
+        yield f"request.post_{name}", lambda data=data: client.post("/", data=data)
+
+    # Cold start: fresh interpreter, import, first GET / (scale-to-zero path).
+    here = os.path.dirname(os.path.abspath(__file__))
+    cold = [sys.executable, "-c", "import main; assert main.app.test_client().get('/').status_code == 200"]
+    yield "startup.first_response", lambda: subprocess.run(cold, cwd=here, check=True)
+
+def loops_for(fn, min_time):
+    # How many calls take ~min_time.
+    n = 1
+    while True:
+        t0 = time.perf_counter()
+        for _ in range(n):
+            fn()
+        dt = time.perf_counter() - t0
+        if dt >= min_time / 4:
+            break
+        n *= 4
+    return max(1, int(n * min_time / max(dt, 1e-9)))
+
+def run(selected=None, min_time=0.05, repeat=25):
+    # Cases are timed in `repeat` interleaved rounds of short runs and each
+    # keeps its median, so a slow spell on a shared machine lands on a few
+    # rounds of every case instead of on every round of a few cases.
+    chosen = [(name, fn) for name, fn in cases() if not selected or any(name.startswith(s) for s in selected)]
+    loops = [(name, fn, loops_for(fn, min_time)) for name, fn in chosen]
+    times = {name: [] for name, _ in chosen}
+    for _ in range(repeat):
+        for name, fn, n in loops:
+            t0 = time.perf_counter()
+            for _ in range(n):
+                fn()
+            times[name].append((time.perf_counter() - t0) / n)
+    results = {}
+    for name, samples in times.items():
+        results[name] = round(statistics.median(samples) * 1e9, 1)
+        print(f"{name:32s} {results[name]:>12,.1f} ns/op", file=sys.stderr)
+    return results
+
+def compare(results, baseline, threshold):
+    # Between runs the whole machine speeds up or slows down (x0.85-1.18 on a
+    # shared 1-CPU box), so each case is judged relative to the median ratio
+    # over all cases, and that median is checked on its own for slowdowns
+    # that hit everything.
+    ratios = {name: ns / baseline[name] for name, ns in sorted(results.items()) if baseline.get(name)}
+    if not ratios:
+        return []
+    drift = statistics.median(ratios.values())
+    regressions = ["(all cases)"] if drift > 1 + threshold else []
+    print(f"{'all cases (median)':32s} x{drift:.2f} {'REGRESSION' if regressions else ''}", file=sys.stderr)
+    for name, ratio in ratios.items():
+        flag = "REGRESSION" if ratio / drift > 1 + threshold else ""
+        print(f"{name:32s} {baseline[name]:>12,.1f} -> {results[name]:>12,.1f} ns/op  x{ratio:.2f}"
+              f" (x{ratio / drift:.2f} of median) {flag}", file=sys.stderr)
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def cli(argv=None):
+    here = os.path.dirname(os.path.abspath(__file__))
+    parser = argparse.ArgumentParser(description="Benchmark the body fat calculator")
+    parser.add_argument("only", nargs="*", help="run only cases whose name starts with one of these")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--baseline", default=os.path.join(here, "bench_baseline.json"))
+    parser.add_argument("--threshold", type=float, default=0.25, help="allowed slowdown ratio (0.25 = 25%%)")
+    parser.add_argument("--min-time", type=float, default=0.05, help="seconds per timing run")
+    parser.add_argument("--repeat", type=int, default=25, help="interleaved rounds; each case keeps its median")
+    parser.add_argument("--update-baseline", action="store_true")
+    args = parser.parse_args(argv)
+
+    doc = {
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "unit": "ns/op",
+        "results": run(args.only, args.min_time, args.repeat),
+    }
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+    if args.update_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+            f.write("\n")
+        return 0
+    if not os.path.exists(args.baseline):
+        print(f"no baseline at {args.baseline}; run with --update-baseline", file=sys.stderr)
+        return 0
+    with open(args.baseline) as f:
+        baseline = json.load(f)["results"]
+    regressions = compare(doc["results"], baseline, args.threshold)
+    if regressions:
+        print(f"{len(regressions)} case(s) slower than baseline by more than {args.threshold:.0%}", file=sys.stderr)
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -0,0 +1,291 @@
+# loadtest.py -- closed/open-loop HTTP load test of the calculator routes.
+#
+#   python loadtest.py                           # start a local server, 16 clients for 10 s
+#   python loadtest.py -c 64 -d 30 --workers 2   # more clients against a 2-worker server
+#   python loadtest.py --url http://127.0.0.1:8080 --rate 500
+#   python loadtest.py --mix get=1,valid=3 --p99-ms 50   # exit 1 if p99 > 50 ms
+#
+# Only the standard library and main.py are used: requests are sent by an
+# asyncio client over keep-alive connections, and every response is checked
+# against the outcome main.evaluate() gives for the same form.
+import argparse, asyncio, itertools, json, os, random, socket, subprocess, sys, tempfile, time, urllib.parse
+
+from markupsafe import escape
+
+# Expected outcomes are computed in this process; it must never record them.
+os.environ["BODYFAT_HISTORY_DB"] = ""
+import main
+
+METRIC_MALE = dict(sex="male", age="30", height_unit="cm", height_cm="180", weight_unit="kg", weight_val="80",
+                   neck_unit="cm", neck_val="38", waist_unit="cm", waist_val="85", hip_unit="cm", hip_val="")
+IMPERIAL_FEMALE = dict(sex="female", age="30", height_unit="ftin", height_ft="5", height_in="5", weight_unit="lb",
+                       weight_val="140", neck_unit="in", neck_val="13", waist_unit="in", waist_val="30",
+                       hip_unit="in", hip_val="38")
+MIXED_MALE = dict(METRIC_MALE, height_unit="ftin", height_ft="5", height_in="11", neck_unit="in", neck_val="15")
+MIXED_FEMALE = dict(IMPERIAL_FEMALE, height_unit="cm", height_cm="165", neck_unit="cm", neck_val="33",
+                    hip_unit="cm", hip_val="98")
+
+# (name, group, form or None for GET). Every reachable ERRORS branch has one;
+# formula_female cannot be reached with in-range values, so it has none.
+SCENARIOS = (
+    ("get", "get", None),
+    ("male_metric", "valid", METRIC_MALE),
+    ("female_imperial", "valid", IMPERIAL_FEMALE),
+    ("male_mixed", "valid", MIXED_MALE),
+    ("female_mixed", "valid", MIXED_FEMALE),
+    ("missing_height", "error", dict(METRIC_MALE, height_cm="")),
+    ("missing_neck", "error", dict(METRIC_MALE, neck_val="")),
+    ("missing_waist", "error", dict(METRIC_MALE, waist_val="")),
+    ("missing_hip", "error", dict(IMPERIAL_FEMALE, hip_val="")),
+    ("age_range", "error", dict(METRIC_MALE, age="5")),
+    ("height_range", "error", dict(METRIC_MALE, height_cm="300")),
+    ("neck_range", "error", dict(METRIC_MALE, neck_val="70")),
+    ("waist_range", "error", dict(METRIC_MALE, waist_val="210")),
+    ("hip_range", "error", dict(MIXED_FEMALE, hip_val="250")),
+    ("hip_range_optional", "error", dict(METRIC_MALE, hip_val="250")),
+    ("weight_range", "error", dict(METRIC_MALE, weight_val="500")),
+    ("formula_male", "error", dict(METRIC_MALE, neck_val="45", waist_val="50")),
+)
+DEFAULT_MIX = "get=3,valid=5,error=2"
+
+class Scenario:
+    # One request kind: the raw HTTP/1.1 request and the text that must
+    # appear in a correct response.
+    def __init__(self, name, host, form):
+        self.name = name
+        if form is None:
+            self.raw = f"GET / HTTP/1.1\r\nHost: {host}\r\n\r\n".encode()
+            self.expect = b"<form"
+            return
+        body = urllib.parse.urlencode(form).encode()
+        self.raw = (f"POST / HTTP/1.1\r\nHost: {host}\r\nContent-Type: application/x-www-form-urlencoded\r\n"
+                    f"Content-Length: {len(body)}\r\n\r\n").encode() + body
+        _, errors, _, _ = main.evaluate(main.SCHEMA.parse(form))
+        if errors and errors[0] != name:
+            raise AssertionError(f"scenario {name} produces {errors[0]}")
+        self.expect = str(escape(main.ERRORS[errors[0]])).encode() if errors else b"Estimated Body Fat:"
+
+def build_mix(spec, host):
+    # "get=3,valid=5,error=2" weights groups (split evenly inside a group);
+    # scenario names can be weighted individually too.
+    weights = {}
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        key, _, w = item.partition("=")
+        members = [s for s in SCENARIOS if key in (s[0], s[1])]
+        if not members:
+            raise SystemExit(f"unknown scenario or group {key!r}")
+        for name, _, _ in members:
+            weights[name] = weights.get(name, 0.0) + float(w or 1) / len(members)
+    scenarios = [Scenario(name, host, form) for name, _, form in SCENARIOS if weights.get(name)]
+    return scenarios, [weights[s.name] for s in scenarios]
+
+async def _exchange(reader, writer, raw):
+    writer.write(raw)
+    await writer.drain()
+    line = await reader.readline()
+    if not line:
+        raise ConnectionError("connection closed")
+    status = int(line.split()[1])
+    length, chunked, close = None, False, False
+    while (line := await reader.readline()) not in (b"\r\n", b""):
+        key, _, value = line.decode("latin-1").partition(":")
+        key, value = key.strip().lower(), value.strip().lower()
+        if key == "content-length":
+            length = int(value)
+        elif key == "transfer-encoding":
+            chunked = "chunked" in value
+        elif key == "connection":
+            close = value == "close"
+    if chunked:
+        parts = []
+        while size := int((await reader.readline()).split(b";")[0], 16):
+            parts.append(await reader.readexactly(size + 2))
+        await reader.readline()
+        body = b"".join(p[:-2] for p in parts)
+    elif length is not None:
+        body = await reader.readexactly(length)
+    else:
+        body, close = await reader.read(), True
+    return status, body, close
+
+async def _client(host, port, pick, clock, stop_at, results):
+    # One virtual user on its own keep-alive connection; reconnects after the
+    # server closes it (Connection: close under backlog, or an error).
+    reader = writer = None
+    while True:
+        start = await clock()
+        if start >= stop_at:
+            break
+        scenario = pick()
+        try:
+            if writer is None:
+                reader, writer = await asyncio.open_connection(host, port)
+            status, body, close = await _exchange(reader, writer, scenario.raw)
+            ok = status == 200 and scenario.expect in body
+        except (OSError, ValueError, asyncio.IncompleteReadError) as e:
+            status, ok, close = type(e).__name__, False, True
+        results.append((start, scenario.name, status, ok, time.perf_counter() - start))
+        if close and writer is not None:
+            writer.close()
+            writer = None
+    if writer is not None:
+        writer.close()
+
+async def run(host, port, scenarios, weights, concurrency, duration, rate=None, warmup=1.0, seed=0):
+    """Drive the server for warmup + duration seconds and return the results
+    started after warmup as (scenario, status, ok, seconds). Without ``rate``
+    each client sends its next request when the last one returns; with it,
+    requests start on a fixed schedule and latency is measured from the
+    scheduled time, so a slow server cannot hide its queueing."""
+    rng = random.Random(seed)
+    pick = lambda: rng.choices(scenarios, weights)[0]
+    t0 = time.perf_counter()
+    stop_at = t0 + warmup + duration
+    if rate:
+        ticks = itertools.count()
+
+        async def clock():
+            at = t0 + next(ticks) / rate
+            await asyncio.sleep(max(0.0, at - time.perf_counter()))
+            return at
+    else:
+        async def clock():
+            return time.perf_counter()
+    results = []
+    await asyncio.gather(*(_client(host, port, pick, clock, stop_at, results) for _ in range(concurrency)))
+    return [r[1:] for r in results if r[0] >= t0 + warmup]
+
+def _pct(sorted_s, q):
+    return sorted_s[min(len(sorted_s) - 1, int(q * len(sorted_s)))] * 1e3 if sorted_s else 0.0
+
+def summarize(results, duration):
+    groups = {"all": results}
+    for r in results:
+        groups.setdefault(r[0], []).append(r)
+    out = {}
+    for name, rows in groups.items():
+        lat = sorted(r[3] for r in rows)
+        statuses = {}
+        for r in rows:
+            statuses[str(r[1])] = statuses.get(str(r[1]), 0) + 1
+        out[name] = {
+            "requests": len(rows),
+            "rps": round(len(rows) / duration, 1),
+            "failed": sum(not r[2] for r in rows),
+            "p50_ms": round(_pct(lat, 0.50), 3),
+            "p95_ms": round(_pct(lat, 0.95), 3),
+            "p99_ms": round(_pct(lat, 0.99), 3),
+            "max_ms": round(lat[-1] * 1e3 if lat else 0.0, 3),
+            "status": statuses,
+        }
+    return out
+
+def report(summary):
+    print(f"{'scenario':20s} {'reqs':>8s} {'req/s':>9s} {'fail':>6s} {'p50':>8s} {'p95':>8s} {'p99':>8s} {'max':>8s}  (ms)",
+          file=sys.stderr)
+    for name in sorted(summary, key=lambda n: (n == "all", n)):
+        s = summary[name]
+        print(f"{name:20s} {s['requests']:>8d} {s['rps']:>9.1f} {s['failed']:>6d} {s['p50_ms']:>8.2f} "
+              f"{s['p95_ms']:>8.2f} {s['p99_ms']:>8.2f} {s['max_ms']:>8.2f}", file=sys.stderr)
+    print("status: " + ", ".join(f"{k}={v}" for k, v in sorted(summary["all"]["status"].items())), file=sys.stderr)
+
+def check_budgets(total, budgets, max_error_rate):
+    violations = [f"{key} {total[key]:.2f} ms > {limit:g} ms" for key, limit in budgets.items()
+                  if limit is not None and total[key] > limit]
+    rate = total["failed"] / max(1, total["requests"])
+    if rate > max_error_rate:
+        violations.append(f"error rate {rate:.2%} > {max_error_rate:.2%}")
+    if not total["requests"]:
+        violations.append("no requests completed")
+    return violations
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def start_server(workers, threads):
+    # A throwaway instance: its own port, history DB and job directory.
+    here = os.path.dirname(os.path.abspath(__file__))
+    tmp = tempfile.mkdtemp(prefix="bodyfat-loadtest-")
+    env = dict(os.environ, BODYFAT_HISTORY_DB=os.path.join(tmp, "history.db"), BODYFAT_JOBS_DIR=os.path.join(tmp, "jobs"))
+    port = _free_port()
+    cmd = [sys.executable, os.path.join(here, "main.py"), "serve", "--host", "127.0.0.1", "--port", str(port),
+           "--workers", str(workers)]
+    if threads:
+        cmd += ["--threads", str(threads)]
+    # The access log goes to a file so it neither floods the report nor
+    # competes with the server for the terminal.
+    log = os.path.join(tmp, "server.log")
+    with open(log, "wb") as f:
+        proc = subprocess.Popen(cmd, cwd=here, env=env, stdout=f, stderr=subprocess.STDOUT)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise SystemExit(f"server exited with status {proc.returncode}; see {log}")
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1) as s:
+                s.sendall(b"GET /readyz HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                if s.recv(64).split(b"\r\n", 1)[0].split()[1:2] == [b"200"]:
+                    return proc, port
+        except OSError:
+            pass
+        time.sleep(0.1)
+    proc.terminate()
+    raise SystemExit(f"server did not become ready within 30 s; see {log}")
+
+def cli(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the body fat calculator page")
+    parser.add_argument("--url", help="target a running server (http://host:port) instead of starting one")
+    parser.add_argument("--workers", type=int, default=1, help="worker processes for the local server")
+    parser.add_argument("--threads", type=int, help="threads per worker for the local server")
+    parser.add_argument("-c", "--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("-d", "--duration", type=float, default=10.0, help="measured seconds")
+    parser.add_argument("--warmup", type=float, default=1.0, help="seconds run before measuring")
+    parser.add_argument("--rate", type=float, help="open loop: start this many requests per second")
+    parser.add_argument("--mix", default=DEFAULT_MIX,
+                        help=f"weights by group (get, valid, error) or scenario name (default {DEFAULT_MIX})")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--p50-ms", type=float, help="fail if overall p50 exceeds this")
+    parser.add_argument("--p95-ms", type=float, help="fail if overall p95 exceeds this")
+    parser.add_argument("--p99-ms", type=float, help="fail if overall p99 exceeds this")
+    parser.add_argument("--max-error-rate", type=float, default=0.0,
+                        help="allowed fraction of failed requests (wrong status or body, 503s, connection errors)")
+    parser.add_argument("--out", help="write the summary JSON here")
+    parser.add_argument("--list", action="store_true", help="list scenarios and exit")
+    args = parser.parse_args(argv)
+
+    if args.list:
+        for name, group, _ in SCENARIOS:
+            print(f"{group:6s} {name}")
+        return 0
+    proc = None
+    if args.url:
+        target = urllib.parse.urlsplit(args.url)
+        host, port = target.hostname, target.port or 80
+    else:
+        proc, port = start_server(args.workers, args.threads)
+        host = "127.0.0.1"
+    try:
+        scenarios, weights = build_mix(args.mix, f"{host}:{port}")
+        results = asyncio.run(run(host, port, scenarios, weights, args.concurrency, args.duration,
+                                  args.rate, args.warmup, args.seed))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait(timeout=30)
+    summary = summarize(results, args.duration)
+    report(summary)
+    doc = {"concurrency": args.concurrency, "duration": args.duration, "rate": args.rate, "mix": args.mix,
+           "results": summary}
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(doc, f, indent=2, sort_keys=True)
+    violations = check_budgets(summary["all"], {"p50_ms": args.p50_ms, "p95_ms": args.p95_ms, "p99_ms": args.p99_ms},
+                               args.max_error_rate)
+    for v in violations:
+        print(f"BUDGET EXCEEDED: {v}", file=sys.stderr)
+    return 1 if violations else 0
+
+if __name__ == "__main__":
+    sys.exit(cli())
@@ -1,12 +1,23 @@
 # main.py
-from flask import Flask, request, render_template_string
-import math, os
+import time
+_T0 = time.perf_counter()  # cold-start clock: imports + app initialization
 
-app = Flask(__name__)
+from flask import Flask, Response, g, request, send_file
+import jinja2
+import argparse, array, atexit, bisect, collections, concurrent.futures, contextlib, csv, enum, gc, gzip, hashlib, hmac, io, itertools, json, marshal, math, mmap, multiprocessing, operator, os, queue, random, re, shutil, signal, socket, sqlite3, struct, subprocess, sys, tempfile, threading, traceback, uuid
+from werkzeug.exceptions import InternalServerError
+from werkzeug.serving import BaseWSGIServer, WSGIRequestHandler, select_address_family
+from werkzeug.wsgi import LimitedStream
+
+# NumPy is optional (batch scoring only) and costs ~100 ms to import, so it is
+# loaded on first batch call rather than at startup; see _require_numpy().
+np = None
+
+app = Flask(__name__, static_folder=None)  # assets are served from ASSETS
 
 # -------- Canonical ranges (server-side truth; metric) --------
 RANGES = {
-    "age": (13, 80),           # years (kept for record; not used in formula)
+    "age": (13, 80),           # years; optional, used by the BMI-based estimators
     "height_cm": (130.0, 230.0),
     "weight_kg": (35.0, 200.0),  # optional; not used in Navy formula
     "neck_cm": (25.0, 60.0),
@@ -14,6 +25,10 @@ RANGES = {
     "hip_cm": (60.0, 200.0),
 }
 
+# Unit factors to metric, shared by parsing (Schema), charts and the inverse solver.
+CM_PER_IN = 2.54
+KG_PER_LB = 0.45359237
+
 PAGE = """
 <!doctype html>
 <html lang="en">
@@ -21,79 +36,7 @@ PAGE = """
   <meta charset="utf-8" />
   <meta name="viewport" content="width=device-width, initial-scale=1" />
   <title>U.S. Navy Body Fat Calculator</title>
-  <style>
-    :root {
-      --bg: #0b0f14;
-      --card: #121822;
-      --muted: #9fb0c3;
-      --accent: #5ac8fa;
-      --ring: #2a80ff33;
-      --text: #e9eef5;
-      --danger: #ff6b6b;
-      --ok: #2ecc71;
-    }
-    * { box-sizing: border-box; }
-    body {
-      margin: 0;
-      font-family: ui-sans-serif, system-ui, -apple-system, Segoe UI, Roboto, Arial;
-      background: radial-gradient(1200px 800px at 80% -20%, #1a2332 0%, #0b0f14 60%);
-      color: var(--text);
-    }
-    .wrap { max-width: 960px; margin: 40px auto; padding: 16px; }
-    .card {
-      background: linear-gradient(180deg, #121822, #0e141d);
-      border: 1px solid #1f2a3a;
-      border-radius: 16px;
-      padding: 24px;
-      box-shadow: 0 10px 30px #0006, inset 0 1px 0 #ffffff12;
-    }
-    h1 { margin: 0 0 8px 0; font-weight: 700; }
-    p.muted { color: var(--muted); margin-top: 0; }
-    .grid { display: grid; grid-template-columns: repeat(12, 1fr); gap: 16px; }
-    .col-12 { grid-column: span 12; }
-    .col-8 { grid-column: span 8; }
-    .col-6 { grid-column: span 6; }
-    .col-4 { grid-column: span 4; }
-    .field { padding: 12px; border-radius: 12px; background: #0b111a; border: 1px solid #1b2636; }
-    .label { font-size: 12px; color: var(--muted); margin-bottom: 6px; display: block; }
-    input[type="number"]{
-      width: 100%;
-      font-size: 16px;
-      padding: 10px 12px;
-      border-radius: 8px;
-      border: 1px solid #1e2a3b;
-      background: #0f1622;
-      color: var(--text);
-      outline: none;
-    }
-    input.bad { border-color: var(--danger); box-shadow: 0 0 0 3px #ff6b6b33; }
-    .unit-row { display: flex; gap: 10px; flex-wrap: wrap; margin: 8px 0 6px; }
-    .radio {
-      display: inline-flex; align-items: center; gap: 8px;
-      font-size: 13px; color: var(--muted);
-      padding: 6px 10px; border: 1px solid #1b2636; border-radius: 999px;
-      cursor: pointer; user-select: none;
-    }
-    .hint { font-size: 12px; color: #9fb0c3; margin-top: 6px; }
-    .buttons { margin-top: 16px; display: flex; gap: 12px; }
-    button {
-      padding: 12px 16px;
-      border-radius: 10px;
-      border: 1px solid #24334a;
-      background: #142033;
-      color: var(--text);
-      cursor: pointer;
-      font-weight: 600;
-    }
-    button.primary { background: linear-gradient(180deg, #1c3454, #142441); border-color: #33527a; }
-    button:disabled { opacity: 0.6; cursor: not-allowed; }
-    .result { margin-top: 16px; padding: 16px; border-radius: 12px; background: #0e1520; }
-    .err { color: var(--danger); }
-    .ok { color: var(--ok); }
-    @media (max-width: 900px){
-      .col-8, .col-6, .col-4 { grid-column: span 12; }
-    }
-  </style>
+  <link rel="stylesheet" href="{{ assets.css }}">
 </head>
 <body>
   <div class="wrap">
@@ -101,31 +44,42 @@ PAGE = """
       <h1>U.S. Navy Body Fat Calculator</h1>
       <p class="muted">Metric or imperial inputs. We convert under the hood, keep you in range, and try not to judge your tape measure skills.</p>
 
-      {% if error %}
-        <div class="result err"><strong>Error:</strong> {{ error }}</div>
+      {% block messages %}
+      {% if errors %}
+        <div class="result err"><strong>Error:</strong> {{ errors|join(" ") }}</div>
       {% endif %}
       {% if result is not none %}
         <div class="result ok">
           <div><strong>Estimated Body Fat:</strong> {{ result }}%</div>
-          {% if show_weight %}<div class="hint">Note: weight is not used by the Navy formula; included for record only.</div>{% endif %}
+          {% if estimates %}<div class="hint">Other estimates: {% for label, value in estimates %}{{ label }} {{ value }}%{% if not loop.last %}, {% endif %}{% endfor %}</div>
+          {% elif show_weight %}<div class="hint">Note: weight is not used by the Navy formula; add your age for BMI-based estimates.</div>{% endif %}
+          {% if percentile %}<div class="hint">That is the {{ percentile }}.</div>{% endif %}
         </div>
       {% endif %}
+      {% endblock %}
 
+      {% block form %}
       <form id="calcForm" method="POST" novalidate>
         <div class="grid">
           <!-- Sex -->
           <div class="col-6 field">
             <span class="label">Sex</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="sex" value="male" {% if form.sex=='male' or not form.sex %}checked{% endif %}> Male</label>
-              <label class="radio"><input type="radio" name="sex" value="female" {% if form.sex=='female' %}checked{% endif %}> Female</label>
+              <label class="radio"><input type="radio" name="sex" value="male" {% if form.sex == Sex.MALE %}checked{% endif %}> Male</label>
+              <label class="radio"><input type="radio" name="sex" value="female" {% if form.sex == Sex.FEMALE %}checked{% endif %}> Female</label>
             </div>
           </div>
 
+          <!-- Subject (keys the measurement history) -->
+          <div class="col-12 field">
+            <label class="label" for="subject">Name or ID <span class="hint">(optional; keeps your history)</span></label>
+            <input type="text" id="subject" name="subject" maxlength="64" placeholder="e.g., alex" value="{{ form.subject or '' }}" autocomplete="username">
+          </div>
+
           <!-- Age (kept for record) -->
           <div class="col-6 field">
             <label class="label" for="age">Age (years)</label>
-            <input type="number" id="age" name="age" min="{{ ranges.age[0] }}" max="{{ ranges.age[1] }}" step="1" placeholder="e.g., 25" value="{{ form.age or '' }}" inputmode="numeric">
+            <input type="number" id="age" name="age" min="{{ ranges.age[0] }}" max="{{ ranges.age[1] }}" step="1" placeholder="e.g., 25" value="{{ form.age|num }}" inputmode="numeric">
             <div class="hint">Allowed: {{ ranges.age[0] }}–{{ ranges.age[1] }} years</div>
           </div>
 
@@ -134,23 +88,23 @@ PAGE = """
           <div class="col-6 field">
             <span class="label">Unit</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="height_unit" value="cm" {% if form.height_unit=='cm' or not form.height_unit %}checked{% endif %} onclick="toggleHeight()"> Centimeters</label>
-              <label class="radio"><input type="radio" name="height_unit" value="ftin" {% if form.height_unit=='ftin' %}checked{% endif %} onclick="toggleHeight()"> Feet + Inches</label>
+              <label class="radio"><input type="radio" name="height_unit" value="cm" {% if form.height_unit == Unit.CM %}checked{% endif %} onclick="toggleHeight()"> Centimeters</label>
+              <label class="radio"><input type="radio" name="height_unit" value="ftin" {% if form.height_unit == Unit.FTIN %}checked{% endif %} onclick="toggleHeight()"> Feet + Inches</label>
             </div>
             <div id="height_cm_box" style="margin-top:8px;">
               <label class="label" for="height_cm">Height (cm)</label>
-              <input type="number" id="height_cm" name="height_cm" step="0.1" placeholder="e.g., 175.0" value="{{ form.height_cm or '' }}" inputmode="decimal">
+              <input type="number" id="height_cm" name="height_cm" step="0.1" placeholder="e.g., 175.0" value="{{ form.height_cm|num }}" inputmode="decimal">
               <div class="hint">Allowed: {{ ranges.height_cm[0] }}–{{ ranges.height_cm[1] }} cm</div>
             </div>
             <div id="height_ftin_box" style="display:none; margin-top:8px;">
               <div class="grid">
                 <div class="col-6">
                   <label class="label" for="height_ft">Feet</label>
-                  <input type="number" id="height_ft" name="height_ft" step="1" placeholder="e.g., 5" value="{{ form.height_ft or '' }}" inputmode="numeric">
+                  <input type="number" id="height_ft" name="height_ft" step="1" placeholder="e.g., 5" value="{{ form.height_ft|num }}" inputmode="numeric">
                 </div>
                 <div class="col-6">
                   <label class="label" for="height_in">Inches</label>
-                  <input type="number" id="height_in" name="height_in" step="0.1" placeholder="e.g., 9.0" value="{{ form.height_in or '' }}" inputmode="decimal">
+                  <input type="number" id="height_in" name="height_in" step="0.1" placeholder="e.g., 9.0" value="{{ form.height_in|num }}" inputmode="decimal">
                 </div>
               </div>
               <div class="hint" id="height_range_hint"></div>
@@ -161,12 +115,12 @@ PAGE = """
           <div class="col-6 field">
             <span class="label">Weight Unit</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="weight_unit" value="kg" {% if form.weight_unit=='kg' or not form.weight_unit %}checked{% endif %} onclick="onUnitToggle()"> kg</label>
-              <label class="radio"><input type="radio" name="weight_unit" value="lb" {% if form.weight_unit=='lb' %}checked{% endif %} onclick="onUnitToggle()"> lbs</label>
+              <label class="radio"><input type="radio" name="weight_unit" value="kg" {% if form.weight_unit == Unit.KG %}checked{% endif %} onclick="onUnitToggle()"> kg</label>
+              <label class="radio"><input type="radio" name="weight_unit" value="lb" {% if form.weight_unit == Unit.LB %}checked{% endif %} onclick="onUnitToggle()"> lbs</label>
             </div>
             <div id="weight_box" style="margin-top:8px;">
               <label class="label" for="weight_val">Weight</label>
-              <input type="number" id="weight_val" name="weight_val" step="0.1" placeholder="e.g., 70.0" value="{{ form.weight_val or '' }}" inputmode="decimal">
+              <input type="number" id="weight_val" name="weight_val" step="0.1" placeholder="e.g., 70.0" value="{{ form.weight_val|num }}" inputmode="decimal">
               <div class="hint" id="weight_range_hint"></div>
             </div>
           </div>
@@ -175,11 +129,11 @@ PAGE = """
           <div class="col-6 field">
             <span class="label">Neck Unit</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="neck_unit" value="cm" {% if form.neck_unit=='cm' or not form.neck_unit %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
-              <label class="radio"><input type="radio" name="neck_unit" value="in" {% if form.neck_unit=='in' %}checked{% endif %} onclick="onUnitToggle()"> in</label>
+              <label class="radio"><input type="radio" name="neck_unit" value="cm" {% if form.neck_unit == Unit.CM %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
+              <label class="radio"><input type="radio" name="neck_unit" value="in" {% if form.neck_unit == Unit.IN %}checked{% endif %} onclick="onUnitToggle()"> in</label>
             </div>
             <label class="label" for="neck_val">Neck circumference</label>
-            <input type="number" id="neck_val" name="neck_val" step="0.1" placeholder="e.g., 38.0" value="{{ form.neck_val or '' }}" inputmode="decimal">
+            <input type="number" id="neck_val" name="neck_val" step="0.1" placeholder="e.g., 38.0" value="{{ form.neck_val|num }}" inputmode="decimal">
             <div class="hint" id="neck_range_hint"></div>
           </div>
 
@@ -187,11 +141,11 @@ PAGE = """
           <div class="col-6 field">
             <span class="label">Waist Unit</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="waist_unit" value="cm" {% if form.waist_unit=='cm' or not form.waist_unit %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
-              <label class="radio"><input type="radio" name="waist_unit" value="in" {% if form.waist_unit=='in' %}checked{% endif %} onclick="onUnitToggle()"> in</label>
+              <label class="radio"><input type="radio" name="waist_unit" value="cm" {% if form.waist_unit == Unit.CM %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
+              <label class="radio"><input type="radio" name="waist_unit" value="in" {% if form.waist_unit == Unit.IN %}checked{% endif %} onclick="onUnitToggle()"> in</label>
             </div>
             <label class="label" for="waist_val">Waist circumference</label>
-            <input type="number" id="waist_val" name="waist_val" step="0.1" placeholder="e.g., 82.0" value="{{ form.waist_val or '' }}" inputmode="decimal">
+            <input type="number" id="waist_val" name="waist_val" step="0.1" placeholder="e.g., 82.0" value="{{ form.waist_val|num }}" inputmode="decimal">
             <div class="hint" id="waist_range_hint"></div>
           </div>
 
@@ -199,11 +153,11 @@ PAGE = """
           <div class="col-6 field">
             <span class="label">Hip Unit</span>
             <div class="unit-row">
-              <label class="radio"><input type="radio" name="hip_unit" value="cm" {% if form.hip_unit=='cm' or not form.hip_unit %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
-              <label class="radio"><input type="radio" name="hip_unit" value="in" {% if form.hip_unit=='in' %}checked{% endif %} onclick="onUnitToggle()"> in</label>
+              <label class="radio"><input type="radio" name="hip_unit" value="cm" {% if form.hip_unit == Unit.CM %}checked{% endif %} onclick="onUnitToggle()"> cm</label>
+              <label class="radio"><input type="radio" name="hip_unit" value="in" {% if form.hip_unit == Unit.IN %}checked{% endif %} onclick="onUnitToggle()"> in</label>
             </div>
             <label class="label" for="hip_val">Hip circumference <span class="hint">(required for female)</span></label>
-            <input type="number" id="hip_val" name="hip_val" step="0.1" placeholder="e.g., 95.0" value="{{ form.hip_val or '' }}" inputmode="decimal">
+            <input type="number" id="hip_val" name="hip_val" step="0.1" placeholder="e.g., 95.0" value="{{ form.hip_val|num }}" inputmode="decimal">
             <div class="hint" id="hip_range_hint"></div>
           </div>
 
@@ -213,295 +167,17 @@ PAGE = """
           </div>
         </div>
       </form>
+      {% endblock %}
     </div>
   </div>
 
-  <script>
-    // ------- helpers -------
-    const ranges = {
-      height_cm: {min: {{ ranges.height_cm[0] }}, max: {{ ranges.height_cm[1] }}},
-      weight_kg: {min: {{ ranges.weight_kg[0] }}, max: {{ ranges.weight_kg[1] }}},
-      neck_cm:   {min: {{ ranges.neck_cm[0] }},   max: {{ ranges.neck_cm[1] }}},
-      waist_cm:  {min: {{ ranges.waist_cm[0] }},  max: {{ ranges.waist_cm[1] }}},
-      hip_cm:    {min: {{ ranges.hip_cm[0] }},    max: {{ ranges.hip_cm[1] }}},
-      age:       {min: {{ ranges.age[0] }},       max: {{ ranges.age[1] }}},
-    };
-    const cmPerIn = 2.54;
-    const kgPerLb = 0.45359237;
-
-    const examples = {
-      weight_kg: 70.0,
-      neck_cm: 38.0,
-      waist_cm: 82.0,
-      hip_cm: 95.0
-    };
-
-    function clamp(v, lo, hi){ return Math.min(hi, Math.max(lo, v)); }
-    function setText(id, txt){ const el = document.getElementById(id); if(el) el.textContent = txt; }
-    function setPH(id, txt){ const el = document.getElementById(id); if(el) el.setAttribute('placeholder', txt); }
-
-    function curVal(id){
-      const el = document.getElementById(id);
-      if(!el || el.value === "") return null;
-      const v = parseFloat(el.value);
-      return Number.isNaN(v) ? null : v;
-    }
-
-    // numeric guards
-    function attachNumericGuards(sel){
-      document.querySelectorAll(sel).forEach(inp => {
-        inp.addEventListener('keydown', function(e){
-          const allowed = ["Backspace","Tab","ArrowLeft","ArrowRight","Delete","Enter",".","Home","End"];
-          if ((e.key >= "0" && e.key <= "9") || allowed.includes(e.key)) {
-            if (e.key === "." && this.value.includes(".")) e.preventDefault();
-            return;
-          }
-          if ((e.ctrlKey || e.metaKey) && ["a","c","v","x","z","y"].includes(e.key.toLowerCase())) return;
-          e.preventDefault();
-        });
-      });
-    }
-    attachNumericGuards('input[type="number"]');
-
-    // ------- placeholders that follow unit toggles (weight, neck, waist, hip) -------
-    function kgToLb(kg){ return kg / kgPerLb; }
-    function cmToIn(cm){ return cm / cmPerIn; }
-
-    function updatePlaceholders(){
-      // Weight example
-      const wUnit = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
-      if(wUnit === 'kg'){
-        setPH('weight_val', `e.g., ${examples.weight_kg.toFixed(1)}`);
-      } else {
-        const lb = kgToLb(examples.weight_kg);
-        setPH('weight_val', `e.g., ${Math.round(lb)}`);
-      }
-      // Neck example
-      const nUnit = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
-      if(nUnit === 'cm'){
-        setPH('neck_val', `e.g., ${examples.neck_cm.toFixed(1)}`);
-      } else {
-        setPH('neck_val', `e.g., ${ (Math.round(cmToIn(examples.neck_cm)*10)/10).toFixed(1) }`);
-      }
-      // Waist example
-      const wU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
-      if(wU === 'cm'){
-        setPH('waist_val', `e.g., ${examples.waist_cm.toFixed(1)}`);
-      } else {
-        setPH('waist_val', `e.g., ${ (Math.round(cmToIn(examples.waist_cm)*10)/10).toFixed(1) }`);
-      }
-      // Hip example
-      const hU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
-      if(hU === 'cm'){
-        setPH('hip_val', `e.g., ${examples.hip_cm.toFixed(1)}`);
-      } else {
-        setPH('hip_val', `e.g., ${ (Math.round(cmToIn(examples.hip_cm)*10)/10).toFixed(1) }`);
-      }
-    }
-
-    // ------- unit UI/hints -------
-    function toggleHeight(){
-      const unit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
-      const cmBox = document.getElementById('height_cm_box');
-      const ftinBox = document.getElementById('height_ftin_box');
-      if(unit === 'cm'){ cmBox.style.display = ''; ftinBox.style.display = 'none'; }
-      else { cmBox.style.display = 'none'; ftinBox.style.display = ''; }
-      updateHints();
-      markAllValidity();
-    }
-
-    function onUnitToggle(){
-      updateHints();
-      updatePlaceholders();
-      markAllValidity();
-    }
-
-    function updateHints(){
-      // Height hint (ft/in range)
-      const ftRange = cmToFeetInRange(ranges.height_cm.min, ranges.height_cm.max);
-      setText('height_range_hint', `Allowed: ${ftRange.min.ft}′${ftRange.min.in.toFixed(1)}″–${ftRange.max.ft}′${ftRange.max.in.toFixed(1)}″`);
-      // Weight hint
-      const unitW = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
-      if(unitW === 'kg'){
-        setText('weight_range_hint', `Allowed: ${ranges.weight_kg.min}–${ranges.weight_kg.max} kg`);
-      } else {
-        const lo = ranges.weight_kg.min / kgPerLb;
-        const hi = ranges.weight_kg.max / kgPerLb;
-        setText('weight_range_hint', `Allowed: ${lo.toFixed(1)}–${hi.toFixed(1)} lbs`);
-      }
-      // Neck/Waist/Hip hints
-      const nkU = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
-      const wsU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
-      const hpU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
-      setText('neck_range_hint',  rangeHint('neck_cm',  nkU));
-      setText('waist_range_hint', rangeHint('waist_cm', wsU));
-      setText('hip_range_hint',   rangeHint('hip_cm',   hpU));
-    }
-
-    function rangeHint(metricKey, unit){
-      const {min, max} = ranges[metricKey];
-      if(unit === 'cm') return `Allowed: ${min}–${max} cm`;
-      const lo = min / cmPerIn;
-      const hi = max / cmPerIn;
-      return `Allowed: ${lo.toFixed(1)}–${hi.toFixed(1)} in`;
-    }
-
-    function cmToFeetIn(cm){
-      const totalIn = cm / cmPerIn;
-      const ft = Math.floor(totalIn / 12);
-      const inch = totalIn - ft*12;
-      return {ft, inch};
-    }
-    function cmToFeetInRange(minCm, maxCm){
-      const a = cmToFeetIn(minCm);
-      const b = cmToFeetIn(maxCm);
-      return {min: {ft:a.ft, in:a.inch}, max:{ft:b.ft, in:b.inch}};
-    }
-
-    // ------- validation that respects units -------
-    const submitBtn = document.getElementById('submitBtn');
-
-    function isInRangeMetric(v, key){
-      const r = ranges[key];
-      return v !== null && !Number.isNaN(v) && v >= r.min && v <= r.max;
-    }
-
-    function markBad(el, bad){
-      if(!el) return;
-      if(bad) el.classList.add('bad'); else el.classList.remove('bad');
-    }
-
-    function getEffectiveValuesMetric(){
-      // Height
-      const hUnit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
-      let height_cm = null;
-      if(hUnit === 'cm'){
-        const v = curVal('height_cm');
-        height_cm = v;
-      } else {
-        const ft = curVal('height_ft') || 0;
-        const inch = curVal('height_in') || 0;
-        const totalIn = ft*12 + inch;
-        height_cm = totalIn * cmPerIn;
-      }
-      // Weight
-      const wUnit = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
-      let weight_kg = null;
-      const w = curVal('weight_val');
-      if(w !== null){
-        weight_kg = (wUnit === 'kg') ? w : w * kgPerLb;
-      }
-      // Neck
-      const nUnit = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
-      let neck_cm = null;
-      const n = curVal('neck_val');
-      if(n !== null) neck_cm = (nUnit === 'cm') ? n : n * cmPerIn;
-      // Waist
-      const wU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
-      let waist_cm = null;
-      const wv = curVal('waist_val');
-      if(wv !== null) waist_cm = (wU === 'cm') ? wv : wv * cmPerIn;
-      // Hip
-      const hU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
-      let hip_cm = null;
-      const hv = curVal('hip_val');
-      if(hv !== null) hip_cm = (hU === 'cm') ? hv : hv * cmPerIn;
-
-      // Age
-      const age = curVal('age');
-
-      return {age, height_cm, weight_kg, neck_cm, waist_cm, hip_cm};
-    }
-
-    function markAllValidity(){
-      const eff = getEffectiveValuesMetric();
-      // Height
-      const hUnit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
-      if(hUnit === 'cm'){
-        markBad(document.getElementById('height_cm'), !isInRangeMetric(eff.height_cm, 'height_cm'));
-      } else {
-        const bad = !isInRangeMetric(eff.height_cm, 'height_cm');
-        markBad(document.getElementById('height_ft'), bad);
-        markBad(document.getElementById('height_in'), bad);
-      }
-      // Weight (optional; only mark if filled)
-      const wBad = (eff.weight_kg !== null) && !isInRangeMetric(eff.weight_kg, 'weight_kg');
-      markBad(document.getElementById('weight_val'), wBad);
-      // Neck/Waist/Hip
-      markBad(document.getElementById('neck_val'),  !isInRangeMetric(eff.neck_cm, 'neck_cm'));
-      markBad(document.getElementById('waist_val'), !isInRangeMetric(eff.waist_cm, 'waist_cm'));
-      const hipEl = document.getElementById('hip_val');
-      if(hipEl.value === "") { markBad(hipEl, false); }
-      else { markBad(hipEl, !isInRangeMetric(eff.hip_cm, 'hip_cm')); }
-      // Age
-      const ageEl = document.getElementById('age');
-      if(ageEl.value === "") markBad(ageEl, false);
-      else markBad(ageEl, !isInRangeMetric(eff.age, 'age'));
-
-      // Disable submit if any .bad present
-      const anyBad = !!document.querySelector('input.bad');
-      submitBtn.disabled = anyBad;
-    }
-
-    function clampOnBlur(e){
-      const id = e.target.id;
-      if(id === 'height_ft' || id === 'height_in'){
-        const eff = getEffectiveValuesMetric();
-        if(eff.height_cm === null) return;
-        let cm = clamp(eff.height_cm, ranges.height_cm.min, ranges.height_cm.max);
-        const totalIn = cm / cmPerIn;
-        const ft = Math.floor(totalIn / 12);
-        const inch = (totalIn - ft*12);
-        document.getElementById('height_ft').value = ft;
-        document.getElementById('height_in').value = Math.round(inch*10)/10;
-      }
-      markAllValidity();
-    }
-
-    function wire(){
-      toggleHeight();
-      updateHints();
-      updatePlaceholders();
-
-      document.querySelectorAll('input[type="number"]').forEach(inp => {
-        inp.addEventListener('input', markAllValidity);
-        inp.addEventListener('blur', clampOnBlur);
-      });
-      ['height_unit','weight_unit','neck_unit','waist_unit','hip_unit'].forEach(name => {
-        document.querySelectorAll(`input[name="${name}"]`).forEach(r => r.addEventListener('change', onUnitToggle));
-      });
-
-      document.getElementById('resetBtn').addEventListener('click', function(){
-        const form = document.getElementById('calcForm');
-        form.reset();
-        document.querySelectorAll('.result').forEach(n => n.remove());
-        document.querySelectorAll('input.bad').forEach(el => el.classList.remove('bad'));
-        submitBtn.disabled = false;
-        toggleHeight(); updateHints(); updatePlaceholders();
-      });
-
-      markAllValidity();
-    }
-
-    wire();
-  </script>
+  <script id="ranges" type="application/json">{{ ranges_js|tojson }}</script>
+  <script id="calc" type="application/json">{{ calc_js|tojson }}</script>
+  <script src="{{ assets.js }}"></script>
 </body>
 </html>
 """
 
-def to_inches(val, unit):
-    if val is None:
-        return None
-    return val / 2.54 if unit == "cm" else val
-
-def height_to_inches(height_unit, cm, ft, inch):
-    if height_unit == "cm":
-        return None if cm is None else cm / 2.54
-    ftv = ft or 0.0
-    inv = inch or 0.0
-    total_in = ftv * 12.0 + inv
-    return None if total_in == 0 else total_in
-
 def navy_bodyfat_percent(sex, height_in, neck_in, waist_in, hip_in=None):
     if sex == "male":
         if any(v is None for v in [height_in, neck_in, waist_in]):
@@ -520,119 +196,2631 @@ def navy_bodyfat_percent(sex, height_in, neck_in, waist_in, hip_in=None):
         bf = 163.205 * math.log10(x) - 97.684 * math.log10(height_in) - 78.387
         return round(bf, 2), None
 
-def _in_range_metric(name, value):
-    lo, hi = RANGES[name]
-    return value is not None and lo <= value <= hi
-
-@app.route("/", methods=["GET","POST"])
-def index():
-    form = {
-        "sex": request.form.get("sex",""),
-        "age": request.form.get("age",""),
-
-        "height_unit": request.form.get("height_unit",""),
-        "height_cm": request.form.get("height_cm",""),
-        "height_ft": request.form.get("height_ft",""),
-        "height_in": request.form.get("height_in",""),
-
-        "weight_unit": request.form.get("weight_unit",""),
-        "weight_val": request.form.get("weight_val",""),
+# -------- Batch engine (NumPy; columnar counterpart of navy_bodyfat_percent) --------
+BF_OK = 0
+BF_MALE_MISSING = 1
+BF_MALE_DOMAIN = 2
+BF_FEMALE_MISSING = 3
+BF_FEMALE_DOMAIN = 4
+
+BF_ERRORS = {
+    BF_MALE_MISSING: "Missing required measurements for male.",
+    BF_MALE_DOMAIN: "For male, waist must be greater than neck, and height must be positive.",
+    BF_FEMALE_MISSING: "Missing required measurements for female.",
+    BF_FEMALE_DOMAIN: "For female, waist + hip must be greater than neck, and height must be positive.",
+}
 
-        "neck_unit": request.form.get("neck_unit",""),
-        "neck_val": request.form.get("neck_val",""),
+BF_CLAMP = (-5.0, 75.0)
+
+def _require_numpy():
+    global np
+    if np is None:
+        try:
+            import numpy
+        except ImportError:
+            raise RuntimeError("NumPy is required for batch scoring (pip install numpy).") from None
+        np = numpy
+
+def _round2_exact(bf, fallback):
+    # rint(x*100)/100 matches round(x, 2) except within a hair of a .005 tie,
+    # where the scaled product or a last-ulp log10 difference can tip it.
+    # Those rows are few; redo them with the scalar path.
+    scaled = bf * 100.0
+    out = np.rint(scaled) / 100.0
+    near = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < 1e-6
+    for i in np.flatnonzero(near):
+        out[i] = fallback(i)
+    return out
+
+def navy_bodyfat_batch(male, height_in, neck_in, waist_in, hip_in=None):
+    """Score whole columns at once. ``male`` is a boolean mask; measurement
+    columns are inches with NaN for missing values. Returns (result, code):
+    result is clamped like index() with NaN on error, code is BF_OK or one
+    of the BF_ERRORS keys."""
+    _require_numpy()
+    male = np.asarray(male, dtype=bool)
+    h = np.asarray(height_in, dtype=np.float64)
+    n = np.asarray(neck_in, dtype=np.float64)
+    w = np.asarray(waist_in, dtype=np.float64)
+    hp = np.full(h.shape, np.nan) if hip_in is None else np.asarray(hip_in, dtype=np.float64)
+    female = ~male
+
+    code = np.zeros(h.shape, dtype=np.int8)
+    base_missing = np.isnan(h) | np.isnan(n) | np.isnan(w)
+    m_missing = male & base_missing
+    f_missing = female & (base_missing | np.isnan(hp))
+
+    x = np.where(male, w - n, w + hp - n)
+    domain = ((x <= 0) | (h <= 0)) & ~(m_missing | f_missing)
+    code[male & domain] = BF_MALE_DOMAIN
+    code[female & domain] = BF_FEMALE_DOMAIN
+    code[m_missing] = BF_MALE_MISSING
+    code[f_missing] = BF_FEMALE_MISSING
+    ok = code == BF_OK
+
+    bf = np.full(h.shape, np.nan)
+    with np.errstate(invalid="ignore", divide="ignore"):
+        mm = ok & male
+        bf[mm] = 86.010 * np.log10(x[mm]) - 70.041 * np.log10(h[mm]) + 36.76
+        fm = ok & female
+        bf[fm] = 163.205 * np.log10(x[fm]) - 97.684 * np.log10(h[fm]) - 78.387
+
+        def scalar(i):
+            hip = None if np.isnan(hp[i]) else float(hp[i])
+            return navy_bodyfat_percent("male" if male[i] else "female",
+                                        float(h[i]), float(n[i]), float(w[i]), hip)[0]
+
+        result = _round2_exact(bf, scalar)
+    np.clip(result, *BF_CLAMP, out=result)
+    return result, code
+
+# -------- Inverse solver and lookup charts --------
+# (a, b, c) in bf = a*log10(x) - b*log10(height) + c, with x = waist - neck
+# (male) or waist + hip - neck (female); same constants as navy_bodyfat_percent.
+NAVY_COEFFS = {"male": (86.010, 70.041, 36.76), "female": (163.205, 97.684, -78.387)}
+CHART_STEPS = {"cm": 1.0, "in": 0.5}
+
+def navy_inverse(sex, bodyfat, height_in, neck_in, waist_in=None, hip_in=None):
+    """Closed-form inverse of navy_bodyfat_percent: the waist in inches at
+    which the (unrounded) formula gives ``bodyfat``; for female, pass hip to
+    solve for waist or waist to solve for hip. Returns (value, None) or
+    (None, message)."""
+    if sex != "male" and (waist_in is None) == (hip_in is None):
+        return None, "For female, give exactly one of waist or hip."
+    if height_in is None or neck_in is None or height_in <= 0:
+        return None, "Height and neck are required, and height must be positive."
+    a, b, c = NAVY_COEFFS["male" if sex == "male" else "female"]
+    x = 10 ** ((bodyfat - c + b * math.log10(height_in)) / a)
+    value = x + neck_in - (0.0 if sex == "male" else hip_in if waist_in is None else waist_in)
+    if value <= 0:
+        return None, "No positive measurement gives that body fat."
+    return value, None
+
+def chart_axis(key, unit, step=None):
+    # Grid over RANGES[key] (cm) in `unit`, on multiples of step.
+    _require_numpy()
+    lo, hi = RANGES[key]
+    if unit == "in":
+        lo, hi = lo / CM_PER_IN, hi / CM_PER_IN
+    step = step or CHART_STEPS[unit]
+    return np.round(np.arange(math.ceil(lo / step - 1e-9), math.floor(hi / step + 1e-9) + 1) * step, 6)
+
+def iter_charts(sex, height, neck, unit="cm", waist_step=None, hip_step=None, max_cells=1 << 20):
+    """Body fat lookup tables for many people of one sex at once. ``height``
+    and ``neck`` are sequences in ``unit`` ("cm" or "in"). Yields
+    (start, tables) blocks in input order; tables has shape (people, waist)
+    for male and (people, waist, hip) for female, with values rounded and
+    clamped like index() and NaN where the formula is undefined. Each block
+    is scored in one navy_bodyfat_batch call of at most ~max_cells cells."""
+    _require_numpy()
+    male = sex == "male"
+    height = np.asarray(height, dtype=np.float64)
+    neck = np.asarray(neck, dtype=np.float64)
+    cm = 1.0 if unit == "cm" else CM_PER_IN
+    for key, v in (("height_cm", height), ("neck_cm", neck)):
+        lo, hi = RANGES[key]
+        if not np.all((v * cm >= lo) & (v * cm <= hi)):
+            raise ValueError(f"{key.split('_')[0]} outside {lo:.0f}-{hi:.0f} cm")
+    # Same conversion as evaluate() (metric / CM_PER_IN) so cells match the form exactly.
+    to_in = (lambda v: v) if unit == "in" else (lambda v: v / CM_PER_IN)
+    waist = to_in(chart_axis("waist_cm", unit, waist_step))
+    grid = (len(waist),) if male else (len(waist), len(chart_axis("hip_cm", unit, hip_step)))
+    hip = None if male else to_in(chart_axis("hip_cm", unit, hip_step))
+    per_block = max(1, max_cells // math.prod(grid))
+    for start in range(0, len(height), per_block):
+        h = to_in(height[start:start + per_block])
+        shape = (len(h), *grid)
+        person = (slice(None),) + (None,) * len(grid)
+        cols = [np.broadcast_to(h[person], shape), np.broadcast_to(to_in(neck[start:start + per_block])[person], shape),
+                np.broadcast_to(waist[:, None] if hip is not None else waist, shape)]
+        if hip is not None:
+            cols.append(np.broadcast_to(hip, shape))
+        result, _ = navy_bodyfat_batch(np.full(math.prod(shape), male), *(c.ravel() for c in cols))
+        yield start, result.reshape(shape)
+
+def bodyfat_chart(sex, height, neck, unit="cm", waist_step=None, hip_step=None):
+    # One person's chart: (waist axis, hip axis or None, table) in `unit`.
+    (_, tables), = iter_charts(sex, [height], [neck], unit, waist_step, hip_step)
+    hip = None if sex == "male" else chart_axis("hip_cm", unit, hip_step)
+    return chart_axis("waist_cm", unit, waist_step), hip, tables[0]
+
+# -------- Prebuilt responses (bytes, gzip variant and ETag computed once) --------
+class Prebuilt:
+    # The gzip and identity bodies are different representations, so each has
+    # its own strong ETag; a client holding either is answered with 304.
+    __slots__ = ("body", "gz", "etag", "gz_etag", "mimetype", "cache_control")
+
+    def __init__(self, body, mimetype, cache_control=None):
+        self.body = body
+        self.gz = gzip.compress(body, 9, mtime=0)
+        self.etag = hashlib.sha256(body).hexdigest()[:32]
+        self.gz_etag = f"{self.etag}-gz"
+        self.mimetype = mimetype
+        self.cache_control = cache_control
+
+    def response(self):
+        gz = request.accept_encodings["gzip"]
+        inm = request.if_none_match
+        if self.etag in inm or self.gz_etag in inm:
+            resp = Response(status=304)
+        elif gz:
+            resp = Response(self.gz, mimetype=self.mimetype)
+            resp.headers["Content-Encoding"] = "gzip"
+        else:
+            resp = Response(self.body, mimetype=self.mimetype)
+        resp.set_etag(self.gz_etag if gz else self.etag)
+        resp.vary.add("Accept-Encoding")
+        if self.cache_control:
+            resp.headers["Cache-Control"] = self.cache_control
+        return resp
+
+# -------- Static assets (content-hashed names, cached forever) --------
+STATIC_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "static")
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+def _load_assets(files):
+    assets, urls = {}, {}
+    for kind, filename, mimetype in files:
+        with open(os.path.join(STATIC_DIR, filename), "rb") as f:
+            body = f.read()
+        stem, ext = os.path.splitext(filename)
+        name = f"{stem}.{hashlib.sha256(body).hexdigest()[:12]}{ext}"
+        assets[name] = Prebuilt(body, mimetype, IMMUTABLE)
+        urls[kind] = f"/assets/{name}"
+    return assets, urls
+
+ASSETS, ASSET_URLS = _load_assets((
+    ("css", "calc.css", "text/css"),
+    ("js", "calc.js", "text/javascript"),
+))
+
+@app.route("/assets/<name>")
+def asset(name):
+    if name not in ASSETS:
+        return Response("Not found", status=404, mimetype="text/plain")
+    return ASSETS[name].response()
+
+# -------- Measurement record (parsed once per submission; columnar for bulk) --------
+class Sex(enum.IntEnum):
+    MALE = 0
+    FEMALE = 1
+
+class Unit(enum.IntEnum):
+    CM = 0
+    IN = 1
+    FTIN = 2
+    KG = 3
+    LB = 4
+
+SEX_NAMES = ("male", "female")
+
+class Measurement:
+    """One submission as filled in by Schema.parse: sex and units as enum
+    codes, each value as entered (for re-rendering, where it is the
+    template's ``form``) and the metric values (height_cm, neck_cm, ...
+    weight_kg) that validation and the formula read."""
+    __slots__ = ("subject", "sex", "age",
+                 "height_unit", "height_cm", "height_ft", "height_in",
+                 "weight_unit", "weight_val", "weight_kg",
+                 "neck_unit", "neck_val", "neck_cm",
+                 "waist_unit", "waist_val", "waist_cm",
+                 "hip_unit", "hip_val", "hip_cm")
+
+    def __init__(self):
+        # The blank form: nothing entered, metric units selected.
+        self.subject, self.sex, self.age = None, Sex.MALE, None
+        self.height_unit = self.neck_unit = self.waist_unit = self.hip_unit = Unit.CM
+        self.weight_unit = Unit.KG
+        self.height_cm = self.height_ft = self.height_in = self.weight_val = self.weight_kg = None
+        self.neck_val = self.neck_cm = self.waist_val = self.waist_cm = self.hip_val = self.hip_cm = None
+
+class MeasurementColumns:
+    """Struct-of-arrays form of many Measurements for the batch engine: one
+    float64 array per metric value (NaN when not entered) and one uint8
+    array per enum code, 54 bytes a row."""
+    FLOATS = ("age", "height_cm", "neck_cm", "waist_cm", "hip_cm", "weight_kg")
+    CODES = ("sex", "height_unit", "weight_unit", "neck_unit", "waist_unit", "hip_unit")
+    __slots__ = FLOATS + CODES
+
+    @classmethod
+    def from_measurements(cls, measurements):
+        # Appends into array.array buffers, so only one Measurement needs to
+        # exist at a time when fed from a generator.
+        floats = [(k, array.array("d")) for k in cls.FLOATS]
+        codes = [(k, array.array("B")) for k in cls.CODES]
+        for m in measurements:
+            for k, a in floats:
+                v = getattr(m, k)
+                a.append(math.nan if v is None else v)
+            for k, a in codes:
+                a.append(getattr(m, k))
+        _require_numpy()
+        cols = cls.__new__(cls)
+        for k, a in floats:
+            setattr(cols, k, np.frombuffer(a, dtype=np.float64))
+        for k, a in codes:
+            setattr(cols, k, np.frombuffer(a, dtype=np.uint8))
+        return cols
+
+    def __len__(self):
+        return len(self.sex)
+
+    @property
+    def male(self):
+        return self.sex == Sex.MALE
+
+class EnteredColumns:
+    """Bulk input before unit conversion: every form field as entered (NaN
+    when blank), including split ft + in height, next to the unit codes that
+    say what each value is in. Schema.normalize_columns turns it into
+    MeasurementColumns."""
+    FLOATS = ("age", "height_cm", "height_ft", "height_in", "weight_val", "neck_val", "waist_val", "hip_val")
+    CODES = MeasurementColumns.CODES
+    __slots__ = FLOATS + CODES
+
+    def __len__(self):
+        return len(self.sex)
+
+# -------- Template (compiled once; GET page prebuilt at startup) --------
+FORM_FIELDS = (
+    "subject", "sex", "age",
+    "height_unit", "height_cm", "height_ft", "height_in",
+    "weight_unit", "weight_val",
+    "neck_unit", "neck_val",
+    "waist_unit", "waist_val",
+    "hip_unit", "hip_val",
+)
+EMPTY_FORM = Measurement()
+
+def _compile_page(env, source):
+    # Compiling PAGE costs ~25 ms of cold start; keep the code object in
+    # __pycache__ keyed by source and versions, like .pyc files.
+    key = hashlib.sha256(f"{source}{jinja2.__version__}{sys.version}".encode()).hexdigest()[:16]
+    path = os.path.join(os.path.dirname(os.path.abspath(__file__)), "__pycache__", f"page-{key}.jinja")
+    try:
+        with open(path, "rb") as f:
+            code = marshal.load(f)
+    except (OSError, EOFError, ValueError, TypeError):
+        code = env.compile(source)
+        with contextlib.suppress(OSError):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(f"{path}.{os.getpid()}", "wb") as f:
+                marshal.dump(code, f)
+            os.replace(f"{path}.{os.getpid()}", path)
+    return env.template_class.from_code(env, code, env.make_globals(None))
+
+app.jinja_env.globals.update(Sex=Sex, Unit=Unit)
+app.jinja_env.filters["num"] = lambda v: "" if v is None else f"{v:.15g}"
+PAGE_TEMPLATE = _compile_page(app.jinja_env, PAGE)
+
+def _render_block(name, **ctx):
+    return "".join(PAGE_TEMPLATE.blocks[name](PAGE_TEMPLATE.new_context(ctx)))
+
+def _calc_config():
+    # Everything the page script needs to compute the Navy result exactly as
+    # evaluate() does, so no constant or message is copied into calc.js.
+    return {"coeffs": NAVY_COEFFS, "clamp": BF_CLAMP, "cm_per_in": CM_PER_IN, "kg_per_lb": KG_PER_LB,
+            "errors": ERRORS, "estimators": {name: est.label for name, est in ESTIMATORS.items()},
+            "primary": PRIMARY_ESTIMATOR, "plan": SCHEMA.plan, "record_url": "/api/v1/record"}
+
+def _build_shell():
+    # Render the empty page once, then cut it around the two dynamic blocks
+    # so later renders only produce the messages and form fragments.
+    ctx = dict(result=None, errors=(), form=EMPTY_FORM, ranges=RANGES, show_weight=False, estimates=(), percentile=None,
+               assets=ASSET_URLS,
+               ranges_js={k: {"min": lo, "max": hi} for k, (lo, hi) in RANGES.items()}, calc_js=_calc_config())
+    html = PAGE_TEMPLATE.render(**ctx)
+    messages = _render_block("messages", **ctx)
+    form = _render_block("form", **ctx)
+    i = html.index(messages)
+    j = html.index(form, i + len(messages))
+    return html, (html[:i], html[i + len(messages):j], html[j + len(form):])
+
+def render_page(form, result=None, errors=(), show_weight=False, estimates=(), percentile=None):
+    # estimates: (label, text) pairs shown under the Navy result; percentile:
+    # its text from percentile_view().
+    ctx = dict(result=result, errors=errors, form=form, ranges=RANGES, show_weight=show_weight, estimates=estimates,
+               percentile=percentile)
+    head, mid, tail = _SHELL
+    return head + _render_block("messages", **ctx) + mid + _render_block("form", **ctx) + tail
+
+def get_page_response():
+    return GET_PAGE.response()
+
+def parse_float(s):
+    # "nan" and "inf" count as not entered, which is also how columns store a blank (NaN).
+    if s in ("", None): return None
+    try: v = float(s)
+    except (TypeError, ValueError): return None
+    return v if math.isfinite(v) else None
+
+# -------- Validation schema (declared from RANGES, compiled once) --------
+
+def _span(name, fmt=".0f"):
+    lo, hi = RANGES[name]
+    return f"{lo:{fmt}} and {hi:{fmt}}"
+
+# Code -> message. Order is precedence: when several fire, they are reported
+# in this order, so the first one is what the old first-failure chain showed.
+ERRORS = {
+    "missing_height": "Please enter your height.",
+    "missing_neck": "Please enter your neck circumference.",
+    "missing_waist": "Please enter your waist circumference.",
+    "missing_hip": "Please enter your hip circumference.",
+    "age_range": f"Age must be between {_span('age', '')}.",
+    "height_range": f"Height must be between {_span('height_cm')} cm.",
+    "neck_range": f"Neck must be between {_span('neck_cm')} cm.",
+    "waist_range": f"Waist must be between {_span('waist_cm')} cm.",
+    "hip_range": f"Hip must be between {_span('hip_cm')} cm.",
+    "hip_range_optional": f"If provided, hip must be between {_span('hip_cm')} cm.",
+    "weight_range": f"Weight must be between {_span('weight_kg')} kg.",
+    "formula_male": BF_ERRORS[BF_MALE_DOMAIN],
+    "formula_female": BF_ERRORS[BF_FEMALE_DOMAIN],
+}
+ERROR_BITS = {code: 1 << i for i, code in enumerate(ERRORS)}
+
+class Measure:
+    """One schema entry: the form field it is read from, its units with their
+    factor to metric (``default`` is assumed for anything else), when it is
+    required (True, False or "female") and which error codes it raises.
+    ``split`` maps a unit to (major field, minor field, minor units per
+    major) for values entered in two parts, like ft + in."""
+    __slots__ = ("key", "field", "unit_field", "factors", "default", "split",
+                 "required", "missing", "range", "range_optional")
+
+    def __init__(self, key, field, unit_field=None, factors=None, default=None, split=None,
+                 required=False, missing=None, range=None, range_optional=None):
+        self.key, self.field, self.unit_field = key, field, unit_field
+        self.factors = {Unit[u.upper()]: f for u, f in (factors or {}).items()}
+        self.default = default and Unit[default.upper()]
+        self.split = {Unit[u.upper()]: parts for u, parts in (split or {}).items()}
+        self.required, self.missing, self.range, self.range_optional = required, missing, range, range_optional
+
+# Order matters: it is the order errors are reported in (see ERRORS).
+MEASURES = (
+    Measure("age", "age", range="age_range"),
+    Measure("height_cm", "height_cm", "height_unit", {"cm": 1.0, "ftin": CM_PER_IN}, "cm",
+            split={"ftin": ("height_ft", "height_in", 12.0)},
+            required=True, missing="missing_height", range="height_range"),
+    Measure("neck_cm", "neck_val", "neck_unit", {"cm": 1.0, "in": CM_PER_IN}, "in",
+            required=True, missing="missing_neck", range="neck_range"),
+    Measure("waist_cm", "waist_val", "waist_unit", {"cm": 1.0, "in": CM_PER_IN}, "in",
+            required=True, missing="missing_waist", range="waist_range"),
+    Measure("hip_cm", "hip_val", "hip_unit", {"cm": 1.0, "in": CM_PER_IN}, "in",
+            required="female", missing="missing_hip", range="hip_range",
+            range_optional="hip_range_optional"),
+    Measure("weight_kg", "weight_val", "weight_unit", {"kg": 1.0, "lb": KG_PER_LB}, "kg", range="weight_range"),
+)
+
+class Schema:
+    """MEASURES compiled against RANGES into flat per-field plans, used by
+    both the single-record path (parse/check) and the columnar one
+    (check_columns), so every entry point validates the same way."""
+
+    def __init__(self, measures, ranges):
+        self.keys = tuple(m.key for m in measures)
+        self.readers = tuple(
+            (m.key, m.field, m.unit_field, {u.name.lower(): u for u in m.factors}, m.default, m.factors,
+             m.split, tuple(f for major, minor, _ in m.split.values() for f in (major, minor)))
+            for m in measures)
+        self.plan = tuple(
+            (m.key, m.required, m.missing, *ranges[m.key], m.range, m.range_optional or m.range)
+            for m in measures)
+
+    def parse(self, form):
+        # One pass over any mapping of form fields (form data, a JSON record,
+        # a CSV row) into a Measurement.
+        m = Measurement.__new__(Measurement)
+        m.subject = subject_id(form.get("subject"))
+        m.sex = Sex.FEMALE if form.get("sex") == "female" else Sex.MALE
+        for key, field, unit_field, codes, default, factors, split, split_fields in self.readers:
+            unit = None
+            if unit_field:
+                try:
+                    unit = codes.get(form.get(unit_field), default)
+                except TypeError:  # a JSON list or object: as unknown as any other non-unit
+                    unit = default
+                setattr(m, unit_field, unit)
+            if unit in split:
+                major, minor, per = split[unit]
+                a, b = parse_float(form.get(major)), parse_float(form.get(minor))
+                setattr(m, major, a)
+                setattr(m, minor, b)
+                total = (a or 0.0)*per + (b or 0.0)
+                setattr(m, key, total * factors[unit] if total > 0 else None)
+            else:
+                for f in split_fields:
+                    setattr(m, f, None)
+                v = parse_float(form.get(field))
+                if field != key:
+                    setattr(m, field, v)
+                setattr(m, key, v if v is None or unit is None or factors[unit] == 1.0 else v * factors[unit])
+        return m
+
+    def entered_columns(self, rows):
+        # A chunk of form-field mappings (CSV rows, JSON records) as
+        # EnteredColumns. Text is parsed per cell; unit names become codes
+        # by comparing whole columns, unknown ones taking the default as in
+        # parse().
+        _require_numpy()
+        cols = EnteredColumns.__new__(EnteredColumns)
+        sex = np.array([r.get("sex") for r in rows], dtype=object)
+        cols.sex = (sex == "female").astype(np.uint8)  # Sex.FEMALE == 1
+        for field in EnteredColumns.FLOATS:
+            setattr(cols, field, np.array([parse_float(r.get(field)) for r in rows], dtype=np.float64))
+        for _, _, unit_field, codes, default, *_ in self.readers:
+            if unit_field:
+                text = np.array([r.get(unit_field) for r in rows], dtype=object)
+                code = np.full(len(rows), default, dtype=np.uint8)
+                for name, unit in codes.items():
+                    code[text == name] = unit
+                setattr(cols, unit_field, code)
+        return cols
+
+    def normalize_columns(self, entered):
+        """EnteredColumns -> metric MeasurementColumns with parse()'s exact
+        arithmetic. Each unit is a row mask, so columns that mix units from
+        row to row are converted without per-row branches."""
+        _require_numpy()
+        cols = MeasurementColumns.__new__(MeasurementColumns)
+        cols.sex = entered.sex
+        for key, field, unit_field, _, _, factors, split, _ in self.readers:
+            if not unit_field:
+                setattr(cols, key, getattr(entered, field))
+                continue
+            unit = getattr(entered, unit_field)
+            setattr(cols, unit_field, unit)
+            out = np.full(len(unit), np.nan)
+            for code, factor in factors.items():
+                rows = unit == code
+                if code in split:
+                    # (a or 0.0)*per + (b or 0.0), blank when not positive
+                    major, minor, per = split[code]
+                    a, b = getattr(entered, major)[rows], getattr(entered, minor)[rows]
+                    total = np.where(np.isnan(a), 0.0, a) * per + np.where(np.isnan(b), 0.0, b)
+                    out[rows] = np.where(total > 0, total * factor, np.nan)
+                else:
+                    v = getattr(entered, field)[rows]
+                    out[rows] = v if factor == 1.0 else v * factor
+            setattr(cols, key, out)
+        return cols
+
+    def check(self, m):
+        missing, out_of_range = [], []
+        female = m.sex is Sex.FEMALE
+        for key, required, missing_code, lo, hi, range_code, optional_code in self.plan:
+            v = getattr(m, key)
+            needed = required is True or (required == "female" and female)
+            if v is None:
+                if needed:
+                    missing.append(missing_code)
+            elif not lo <= v <= hi:
+                out_of_range.append(range_code if needed else optional_code)
+        return missing + out_of_range
+
+    def check_columns(self, cols):
+        """Vectorized check over MeasurementColumns. Returns a uint16 array of
+        ERROR_BITS per row."""
+        _require_numpy()
+        male = cols.male
+        mask = np.zeros(male.shape, dtype=np.uint16)
+        for key, required, missing_code, lo, hi, range_code, optional_code in self.plan:
+            v = getattr(cols, key)
+            present = ~np.isnan(v)
+            needed = np.ones(male.shape, bool) if required is True else ~male if required == "female" \
+                else np.zeros(male.shape, bool)
+            bad = present & ~((v >= lo) & (v <= hi))
+            if missing_code:
+                mask[needed & ~present] |= ERROR_BITS[missing_code]
+            mask[bad & needed] |= ERROR_BITS[range_code]
+            mask[bad & ~needed] |= ERROR_BITS[optional_code]
+        return mask
+
+def error_codes(mask):
+    # Bits from Schema.check_columns -> codes in ERRORS order.
+    return [code for code, bit in ERROR_BITS.items() if mask & bit]
+
+SCHEMA = Schema(MEASURES, RANGES)
+
+# -------- Estimators (registry; every applicable formula in one pass) --------
+class Estimator:
+    """A body fat formula over the metric fields of a parsed Measurement.
+    ``inputs`` are the fields its kernels take, in order; ``required`` maps
+    a sex name to the ones that must be present for it to apply (default:
+    all). ``scalar(sex, *values)`` returns the displayed percentage (2
+    places, clamped to BF_CLAMP) or None outside the formula's domain;
+    ``batch(male, *columns)`` is the same over MeasurementColumns arrays,
+    NaN where it does not apply, and must agree with ``scalar`` exactly."""
+    __slots__ = ("name", "label", "inputs", "required", "scalar", "batch", "read", "read_required")
+
+    def __init__(self, name, label, inputs, scalar, batch, required=None):
+        self.name, self.label, self.inputs, self.scalar, self.batch = name, label, tuple(inputs), scalar, batch
+        self.required = tuple(tuple((required or {}).get(sex, inputs)) for sex in SEX_NAMES)  # indexed by Sex
+        # (sex, *fields) off a Measurement in one C call, i.e. the scalar
+        # kernel's arguments; estimate() runs on every POST.
+        self.read = operator.attrgetter("sex", *self.inputs)
+        self.read_required = tuple(operator.attrgetter("sex", *r) for r in self.required)
+
+ESTIMATORS = {}  # name -> Estimator; the page lists them in this order
+PRIMARY_ESTIMATOR = "navy"  # the validated, recorded result
+
+def register_estimator(*args, **kwargs):
+    est = Estimator(*args, **kwargs)
+    ESTIMATORS[est.name] = est
+    return est
+
+def _display(bf):
+    return max(BF_CLAMP[0], min(BF_CLAMP[1], round(bf, 2)))
+
+def _display_batch(bf, scalar):
+    result = _round2_exact(bf, scalar)
+    np.clip(result, *BF_CLAMP, out=result)
+    return result
+
+def _navy_scalar(sex, height_cm, neck_cm, waist_cm, hip_cm):
+    result, _ = navy_bodyfat_percent(SEX_NAMES[sex], height_cm / CM_PER_IN, neck_cm / CM_PER_IN,
+                                     waist_cm / CM_PER_IN, None if hip_cm is None else hip_cm / CM_PER_IN)
+    return None if result is None else max(BF_CLAMP[0], min(BF_CLAMP[1], result))
+
+def _navy_batch(male, height_cm, neck_cm, waist_cm, hip_cm):
+    return navy_bodyfat_batch(male, height_cm / CM_PER_IN, neck_cm / CM_PER_IN, waist_cm / CM_PER_IN,
+                              hip_cm / CM_PER_IN)[0]
+
+# The BMI formulas are written once for floats and arrays alike, so both
+# kernels do the same IEEE operations in the same order.
+def _bmi(height_cm, weight_kg):
+    m = height_cm / 100.0
+    return weight_kg / (m * m)
+
+def _deurenberg(bmi, age, male):
+    # Deurenberg et al. (1991); male is 1 or 0. Children's equation below 16.
+    adult = 1.20 * bmi + 0.23 * age - 10.8 * male - 5.4
+    child = 1.51 * bmi - 0.70 * age - 3.6 * male + 1.4
+    return adult, child
+
+def _cun_bae(bmi, age, female):
+    # Gomez-Ambrosi et al. (2012), validated for ages 18-80; female is 1 or 0.
+    bmi2 = bmi * bmi
+    return (-44.988 + 0.503 * age + 10.689 * female + 3.172 * bmi - 0.026 * bmi2 + 0.181 * bmi * female
+            - 0.02 * bmi * age - 0.005 * bmi2 * female + 0.00021 * bmi2 * age)
+
+def _deurenberg_scalar(sex, height_cm, weight_kg, age):
+    adult, child = _deurenberg(_bmi(height_cm, weight_kg), age, 1.0 if sex == Sex.MALE else 0.0)
+    return _display(adult if age >= 16 else child)
+
+def _deurenberg_batch(male, height_cm, weight_kg, age):
+    adult, child = _deurenberg(_bmi(height_cm, weight_kg), age, male.astype(np.float64))
+    return _display_batch(np.where(age >= 16, adult, child), lambda i: _deurenberg_scalar(
+        Sex.MALE if male[i] else Sex.FEMALE, float(height_cm[i]), float(weight_kg[i]), float(age[i])))
+
+def _cun_bae_scalar(sex, height_cm, weight_kg, age):
+    if age < 18:
+        return None
+    return _display(_cun_bae(_bmi(height_cm, weight_kg), age, 0.0 if sex == Sex.MALE else 1.0))
+
+def _cun_bae_batch(male, height_cm, weight_kg, age):
+    bf = _cun_bae(_bmi(height_cm, weight_kg), age, (~male).astype(np.float64))
+    bf[~(age >= 18)] = np.nan
+    return _display_batch(bf, lambda i: _cun_bae_scalar(
+        Sex.MALE if male[i] else Sex.FEMALE, float(height_cm[i]), float(weight_kg[i]), float(age[i])))
+
+register_estimator("navy", "U.S. Navy", ("height_cm", "neck_cm", "waist_cm", "hip_cm"), _navy_scalar, _navy_batch,
+                   required={"male": ("height_cm", "neck_cm", "waist_cm")})
+register_estimator("deurenberg", "Deurenberg (BMI)", ("height_cm", "weight_kg", "age"),
+                   _deurenberg_scalar, _deurenberg_batch)
+register_estimator("cun_bae", "CUN-BAE (BMI)", ("height_cm", "weight_kg", "age"), _cun_bae_scalar, _cun_bae_batch)
+
+def estimate(m, skip=None):
+    # Every applicable estimator over one validated Measurement, reading the
+    # metric values parse() already converted: {name: percentage}.
+    out = {}
+    for name, est in ESTIMATORS.items():
+        if name == skip:
+            continue
+        if None in est.read_required[m.sex](m):
+            continue
+        v = est.scalar(*est.read(m))
+        if v is not None:
+            out[name] = v
+    return out
+
+def estimate_batch(cols):
+    """Columnar estimate() over MeasurementColumns: {name: float64 array},
+    NaN where an estimator does not apply. Rows are not validated here."""
+    _require_numpy()
+    male = cols.male
+    out = {}
+    for name, est in ESTIMATORS.items():
+        with np.errstate(invalid="ignore", divide="ignore"):  # rows with blanks or zeros come out NaN/inf
+            values = est.batch(male, *(getattr(cols, k) for k in est.inputs))
+        for rows, required in zip((male, ~male), est.required):
+            for k in required:
+                values[rows & np.isnan(getattr(cols, k))] = np.nan
+        out[name] = values
+    return out
+
+# The page embeds ERRORS and the estimator labels, so it is built once both exist.
+GET_HTML, _SHELL = _build_shell()
+GET_PAGE = Prebuilt(GET_HTML.encode("utf-8"), "text/html")
+
+def evaluate_batch(cols):
+    """Columnar evaluate() over MeasurementColumns: validates with
+    SCHEMA.check_columns, then runs every estimator with estimate_batch.
+    Returns (result, mask, estimates) where result is the primary estimate
+    and every array is NaN wherever mask is non-zero."""
+    mask = SCHEMA.check_columns(cols)
+    estimates = estimate_batch(cols)
+    result = estimates[PRIMARY_ESTIMATOR]
+    male = cols.male
+    formula = (mask == 0) & np.isnan(result)
+    mask[formula & male] |= ERROR_BITS["formula_male"]
+    mask[formula & ~male] |= ERROR_BITS["formula_female"]
+    bad = mask != 0
+    for values in estimates.values():
+        values[bad] = np.nan
+    return result, mask, estimates
+
+# -------- Metrics (Prometheus text format; shared across forked workers) --------
+class SharedMetrics:
+    """Counters and histograms kept as float64 cells in an anonymous shared
+    mmap with one row per process. A process claims a row on first use and
+    is its only writer, so workers never contend across processes; /metrics
+    sums the rows. A row left behind by a dead worker is reused as-is, which
+    keeps totals monotonic across restarts."""
+
+    def __init__(self, rows=64):
+        self.rows = rows
+        self.width = 0
+        self.families = []
+        self.buf = None
+        self.lock = multiprocessing.Lock()
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pid = None
+        self._base = 0
+        self._local = threading.Lock()
+
+    def counter(self, name, help, labels):
+        return self._add(_Counter(self, name, help, labels))
+
+    def gauge(self, name, help, labels):
+        return self._add(_Gauge(self, name, help, labels))
+
+    def histogram(self, name, help, labels, buckets):
+        return self._add(_Histogram(self, name, help, labels, buckets))
+
+    def summary(self, name, help, labels, lo, hi, step, shift):
+        return self._add(_Summary(self, name, help, labels, lo, hi, step, shift))
+
+    def _add(self, family):
+        family.offsets = {}
+        for combo in itertools.product(*family.labels.values()):
+            family.offsets[combo] = self.width
+            self.width += family.width
+        self.families.append(family)
+        return family
+
+    def seal(self):
+        # Call once every family is declared, before any fork.
+        self.buf = mmap.mmap(-1, 8 * self.rows * (1 + self.width))
+        self.pids = memoryview(self.buf)[:8 * self.rows].cast("q")
+        self.cells = memoryview(self.buf)[8 * self.rows:].cast("d")
+
+    def _row(self):
+        if self._pid != os.getpid():
+            with self._local:
+                if self._pid != os.getpid():
+                    with self.lock:
+                        row = self._claim(os.getpid())
+                    self._base = row * self.width
+                    for fam in self.families:
+                        if fam.kind == "gauge":  # levels left by a dead owner are not ours
+                            for off in fam.offsets.values():
+                                self.cells[self._base + off] = 0.0
+                    self._pid = os.getpid()
+        return self._base
+
+    def _claim(self, pid):
+        for i in range(self.rows):
+            owner = self.pids[i]
+            if owner in (0, pid) or not _pid_alive(owner):
+                self.pids[i] = pid
+                return i
+        return 0  # more live processes than rows: share the first one
+
+    def totals(self, family):
+        # Merge every process's partial for each label set: all cells are
+        # plain sums, so merging is element-wise addition.
+        live = [r * self.width for r in range(self.rows) if self.pids[r]]
+        for combo, off in family.offsets.items():
+            totals = [0.0] * family.width
+            for base in live:
+                totals = list(map(float.__add__, totals, self.cells[base + off:base + off + family.width]))
+            yield combo, totals
+
+    def render(self):
+        out = []
+        for fam in self.families:
+            out.append(f"# HELP {fam.name} {fam.help}")
+            out.append(f"# TYPE {fam.name} {fam.kind}")
+            for combo, totals in self.totals(fam):
+                fam.export(out, dict(zip(fam.labels, combo)), totals)
+        return "\n".join(out) + "\n"
+
+def _pid_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+def _labels(d):
+    return "{" + ",".join(f'{k}="{v}"' for k, v in d.items()) + "}" if d else ""
+
+def _num(v):
+    return repr(float(v)) if v != int(v) else str(int(v))
+
+class _Counter:
+    kind = "counter"
+    width = 1
+
+    def __init__(self, metrics, name, help, labels):
+        self.metrics, self.name, self.help, self.labels = metrics, name, help, labels
+
+    def inc(self, *labels, n=1):
+        m = self.metrics
+        off = m._row() + self.offsets[labels]
+        with m._local:
+            m.cells[off] += n
+
+    def export(self, out, labels, totals):
+        if totals[0]:
+            out.append(f"{self.name}{_labels(labels)} {_num(totals[0])}")
+
+class _Gauge(_Counter):
+    # Per-process levels; /metrics reports their sum.
+    kind = "gauge"
+
+    def dec(self, *labels, n=1):
+        self.inc(*labels, n=-n)
+
+    def export(self, out, labels, totals):
+        out.append(f"{self.name}{_labels(labels)} {_num(totals[0])}")
+
+class _Histogram:
+    kind = "histogram"
+
+    def __init__(self, metrics, name, help, labels, buckets):
+        self.metrics, self.name, self.help, self.labels = metrics, name, help, labels
+        self.buckets = tuple(buckets)
+        self.width = len(self.buckets) + 3  # buckets, +Inf, sum, count
+
+    def observe(self, labels, value):
+        m = self.metrics
+        off = m._row() + self.offsets[labels]
+        n = len(self.buckets)
+        with m._local:
+            m.cells[off + bisect.bisect_left(self.buckets, value)] += 1
+            m.cells[off + n + 1] += value
+            m.cells[off + n + 2] += 1
+
+    def export(self, out, labels, totals):
+        n = len(self.buckets)
+        if not totals[n + 2]:
+            return
+        cumulative = 0
+        for le, count in zip((*self.buckets, "+Inf"), totals[:n + 1]):
+            cumulative += count
+            out.append(f"{self.name}_bucket{_labels({**labels, 'le': le})} {_num(cumulative)}")
+        out.append(f"{self.name}_sum{_labels(labels)} {_num(totals[n + 1])}")
+        out.append(f"{self.name}_count{_labels(labels)} {_num(totals[n + 2])}")
+
+class _Summary:
+    """Streaming distribution per label set in constant memory: count, sum,
+    sum of squares about a fixed shift (keeps the variance well conditioned
+    without Welford's non-additive state) and a fixed-bin histogram over
+    [lo, hi) as the quantile sketch, accurate to one step."""
+    kind = "summary"
+    quantiles = (0.5, 0.9, 0.99)
+
+    def __init__(self, metrics, name, help, labels, lo, hi, step, shift):
+        self.metrics, self.name, self.help, self.labels = metrics, name, help, labels
+        self.lo, self.hi, self.step, self.shift = lo, hi, step, shift
+        self.bins = round((hi - lo) / step)
+        self.width = 3 + self.bins  # count, sum, shifted sum of squares, bins
+
+    def observe(self, labels, value):
+        m = self.metrics
+        off = m._row() + self.offsets[labels]
+        i = min(max(int((value - self.lo) / self.step), 0), self.bins - 1)
+        d = value - self.shift
+        with m._local:
+            c = m.cells
+            c[off] += 1
+            c[off + 1] += value
+            c[off + 2] += d * d
+            c[off + 3 + i] += 1
+
+    def quantile(self, totals, q):
+        # Linear interpolation inside the bin holding the q-th observation.
+        target, seen = q * totals[0], 0.0
+        for i, count in enumerate(totals[3:]):
+            if count and seen + count >= target:
+                return self.lo + (i + (target - seen) / count) * self.step
+            seen += count
+        return self.hi
+
+    def summarize(self, totals):
+        n, total, squares = totals[:3]
+        if not n:
+            return None
+        mean = total / n
+        var = max(squares - n * (mean - self.shift) ** 2, 0.0) / (n - 1) if n > 1 else 0.0
+        out = {"count": int(n), "mean": mean, "variance": var}
+        for q in self.quantiles:
+            out[f"p{q * 100:g}"] = self.quantile(totals, q)
+        return out
+
+    def export(self, out, labels, totals):
+        if not totals[0]:
+            return
+        for q in self.quantiles:
+            out.append(f"{self.name}{_labels({**labels, 'quantile': q})} {_num(round(self.quantile(totals, q), 4))}")
+        out.append(f"{self.name}_sum{_labels(labels)} {_num(totals[1])}")
+        out.append(f"{self.name}_count{_labels(labels)} {_num(totals[0])}")
+
+OUTCOMES = ("ok", *ERRORS)
+LATENCY_BUCKETS = (1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4, 1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 1.0)
+
+METRICS = SharedMetrics()
+PHASE_SECONDS = METRICS.histogram(
+    "bodyfat_phase_seconds", "Time spent in each phase of a calculator POST.",
+    {"phase": ("parse", "validate", "formula", "render"), "outcome": OUTCOMES}, LATENCY_BUCKETS)
+REQUESTS = METRICS.counter(
+    "bodyfat_requests_total", "Calculator submissions (form POSTs and page beacons) by sex, unit mix and outcome.",
+    {"sex": ("male", "female"), "units": ("metric", "imperial", "mixed"), "outcome": OUTCOMES})
+HISTORY_ROWS = METRICS.counter(
+    "bodyfat_history_rows_total", "Measurement history rows by what happened to them.",
+    {"outcome": ("written", "dropped", "failed")})
+AGE_EDGES = (20, 30, 40, 50, 60, 70)
+AGE_BANDS = ("<20", "20-29", "30-39", "40-49", "50-59", "60-69", "70+", "unknown")
+BODYFAT = METRICS.summary(
+    "bodyfat_percent", "Body fat results by sex and age band (p50/p90/p99 to within 0.1).",
+    {"sex": ("male", "female"), "age_band": AGE_BANDS}, lo=-5.0, hi=75.0, step=0.1, shift=20.0)
+ADMISSION_ROUTES = ("index", "api_record", "api_bodyfat", "api_chart", "api_inverse", "api_job_submit",
+                    "api_job_events")
+ADMISSION_WAIT = METRICS.histogram(
+    "bodyfat_admission_wait_seconds",
+    "Time admitted work waited: for a thread (route=server, per connection) or an in-flight slot.",
+    {"route": ("server", *ADMISSION_ROUTES)}, LATENCY_BUCKETS)
+ADMISSION_IN_FLIGHT = METRICS.gauge(
+    "bodyfat_admission_in_flight", "Admitted requests running, by route.", {"route": ADMISSION_ROUTES})
+ADMISSION_REJECTED = METRICS.counter(
+    "bodyfat_admission_rejected_total", "Requests shed with 503 by route and reason.",
+    {"route": ("server", *ADMISSION_ROUTES), "reason": ("backlog", "queue_full", "timeout")})
+JOBS_QUEUED = METRICS.gauge("bodyfat_jobs_queued", "Bulk jobs waiting for a job worker.", {})
+JOBS_RUNNING = METRICS.gauge("bodyfat_jobs_running", "Bulk jobs being scored.", {})
+JOB_WORKERS = METRICS.gauge("bodyfat_job_workers", "Job worker threads started, across processes.", {})
+JOB_OUTCOMES = METRICS.counter("bodyfat_jobs_total", "Bulk jobs by outcome.",
+                               {"outcome": ("done", "failed", "rejected")})
+JOB_BUSY = METRICS.counter("bodyfat_job_busy_seconds_total",
+                           "Job worker busy time; divide its rate by bodyfat_job_workers for utilization.", {})
+JOB_ROWS = METRICS.counter("bodyfat_job_rows_total", "Rows scored by bulk jobs.", {})
+METRICS.seal()
+
+def age_band(age):
+    return "unknown" if age is None else AGE_BANDS[bisect.bisect_right(AGE_EDGES, age)]
+
+class PhaseTimer:
+    # enter() closes the running phase and starts the next; finish() records
+    # every closed phase under the request's final outcome.
+    __slots__ = ("phase", "t", "spans")
+
+    def __init__(self, phase):
+        self.phase, self.t, self.spans = phase, time.perf_counter(), []
+
+    def enter(self, phase):
+        now = time.perf_counter()
+        self.spans.append((self.phase, now - self.t))
+        self.phase, self.t = phase, now
+
+    def finish(self, outcome):
+        self.enter(None)
+        for phase, secs in self.spans:
+            PHASE_SECONDS.observe((phase, outcome), secs)
+
+class _NoTimer:
+    def enter(self, phase):
+        pass
+
+NO_TIMER = _NoTimer()
+
+def unit_mix(m):
+    metric = (m.height_unit is Unit.CM, m.weight_unit is Unit.KG,
+              m.neck_unit is Unit.CM, m.waist_unit is Unit.CM, m.hip_unit is Unit.CM)
+    return "metric" if all(metric) else "imperial" if not any(metric) else "mixed"
+
+def evaluate(m, timer=NO_TIMER):
+    # Validate and score one parsed Measurement; returns (result, errors, show_weight,
+    # estimates) with result the clamped primary (Navy) estimate, errors a list of
+    # ERRORS codes and estimates {name: percentage} for every applicable estimator.
+    sex = SEX_NAMES[m.sex]
+    show_weight = m.weight_kg is not None
+
+    timer.enter("validate")
+    errors = SCHEMA.check(m)
+    if errors:
+        return None, errors, show_weight, {}
+
+    # Validation and unit conversion are shared; every estimator runs on the
+    # same converted record.
+    timer.enter("formula")
+    estimates = estimate(m)
+    result = estimates.get(PRIMARY_ESTIMATOR)
+    if result is None:
+        return None, [f"formula_{sex}"], show_weight, {}
+    return result, [], show_weight, estimates
+
+def record_result(m, result):
+    # A calculation somebody submitted: live stats, and history when there is
+    # a subject to keep it under. Bulk scoring (CLI, jobs, batch API) only
+    # calls evaluate(), so it records nothing.
+    BODYFAT.observe((SEX_NAMES[m.sex], age_band(m.age)), result)
+    if m.subject is not None:
+        HISTORY.record(m, result)
+
+# -------- Admission control (per-route in-flight limits; shed with 503) --------
+class Admission:
+    """At most ``limit`` requests of one route run at once per process; up to
+    ``queue`` more wait, each for at most ``wait`` seconds. Anything beyond
+    that is rejected at once, so admitted requests keep their latency under
+    overload instead of everyone slowing down together."""
+
+    def __init__(self, route, limit, queue, wait):
+        self.route, self.limit, self.queue, self.wait = route, limit, queue, wait
+        self.cond = threading.Condition()
+        self.active = self.waiting = 0
+
+    def acquire(self):
+        # Returns the seconds spent waiting, or the reason for rejecting.
+        with self.cond:
+            if self.active < self.limit and not self.waiting:
+                self.active += 1
+                return 0.0
+            if self.waiting >= self.queue:
+                return "queue_full"
+            self.waiting += 1
+            t0 = time.perf_counter()
+            try:
+                while self.active >= self.limit:
+                    left = self.wait - (time.perf_counter() - t0)
+                    if left <= 0:
+                        return "timeout"
+                    self.cond.wait(left)
+                self.active += 1
+                return time.perf_counter() - t0
+            finally:
+                self.waiting -= 1
+
+    def release(self):
+        with self.cond:
+            self.active -= 1
+            self.cond.notify()
+
+# route: (in-flight limit, wait queue, max wait seconds) per worker process;
+# override with BODYFAT_ADMISSION="index=2/8/0.05,api_chart=1/4/0.25".
+# A limit of 0 disables admission control for that route.
+ADMISSION_DEFAULTS = {
+    "index": (2, 8, 0.05),
+    "api_record": (2, 8, 0.05),
+    "api_bodyfat": (1, 4, 0.25),
+    "api_chart": (1, 4, 0.25),
+    "api_inverse": (2, 8, 0.05),
+    "api_job_submit": (2, 2, 1.0),
+    "api_job_events": (2, 0, 0.0),  # each follower holds an HTTP thread while it streams
+}
 
-        "waist_unit": request.form.get("waist_unit",""),
-        "waist_val": request.form.get("waist_val",""),
+def _admission_config(spec):
+    limits = dict(ADMISSION_DEFAULTS)
+    for item in filter(None, (p.strip() for p in spec.split(","))):
+        route, _, values = item.partition("=")
+        limit, queue, wait = values.split("/")
+        if route not in limits:
+            raise ValueError(f"BODYFAT_ADMISSION: unknown route {route!r}")
+        limits[route] = (int(limit), int(queue), float(wait))
+    return {route: Admission(route, *v) for route, v in limits.items() if v[0] > 0}
+
+ADMISSION = _admission_config(os.environ.get("BODYFAT_ADMISSION", ""))
+OVERLOADED_RETRY_AFTER = "1"
+
+@app.before_request
+def _admit():
+    gate = ADMISSION.get(request.endpoint)
+    if gate is None or request.method in ("GET", "HEAD") and request.endpoint == "index":
+        return None  # the GET page is prebuilt; only computation is limited
+    waited = gate.acquire()
+    if isinstance(waited, str):
+        ADMISSION_REJECTED.inc(gate.route, waited)
+        return Response(_compact({"error": "Server is busy; please retry shortly."}), status=503,
+                        headers={"Retry-After": OVERLOADED_RETRY_AFTER}, mimetype="application/json")
+    g.admission = _leaver(gate)
+    ADMISSION_WAIT.observe((gate.route,), waited)
+    ADMISSION_IN_FLIGHT.inc(gate.route)
+
+def _leaver(gate):
+    # Releases the slot once, whichever of the hooks below gets there first.
+    left = []
+
+    def leave():
+        if not left:
+            left.append(True)
+            ADMISSION_IN_FLIGHT.dec(gate.route)
+            gate.release()
+    return leave
+
+@app.after_request
+def _release_after(response):
+    # A streamed body is produced after teardown, while the server iterates
+    # it; it keeps its slot until the server closes the response.
+    leave = g.get("admission")
+    if leave is not None:
+        if response.is_streamed:
+            response.call_on_close(leave)
+        else:
+            leave()
+    return response
+
+@app.teardown_request
+def _release(exc):
+    leave = g.pop("admission", None)
+    if leave is not None and exc is not None:
+        leave()  # the view raised: its error page is no work of ours to wait for
+
+# -------- Measurement history (SQLite in WAL mode; batched background writer) --------
+class HistoryStore:
+    """Every successful calculation made under a subject, age and weight included.
+    record() only enqueues; a writer thread per process drains the queue and
+    inserts whatever has piled up in one transaction, so request threads
+    never touch the disk and batches grow with load. When the queue is full,
+    rows are dropped and counted rather than blocking the request. Reads use
+    a small pool of query-only connections; WAL lets them run while the
+    writers (one per worker process) commit."""
+
+    COLUMNS = ("subject", "ts", "sex", "age", "height_cm", "neck_cm", "waist_cm", "hip_cm", "weight_kg", "bodyfat")
+    DDL = """
+        CREATE TABLE IF NOT EXISTS measurements (
+            id INTEGER PRIMARY KEY,
+            subject TEXT, ts REAL NOT NULL, sex TEXT NOT NULL, age REAL,
+            height_cm REAL NOT NULL, neck_cm REAL NOT NULL, waist_cm REAL NOT NULL, hip_cm REAL,
+            weight_kg REAL, bodyfat REAL NOT NULL);
+        CREATE INDEX IF NOT EXISTS measurements_subject_ts ON measurements (subject, ts);
+        CREATE INDEX IF NOT EXISTS measurements_ts ON measurements (ts);
+    """
+
+    def __init__(self, path, batch=1000, max_pending=50000, readers=4):
+        self.path, self.batch, self.max_pending, self.readers = path, batch, max_pending, readers
+        self.insert = f"INSERT INTO measurements ({', '.join(self.COLUMNS)}) VALUES ({', '.join('?' * len(self.COLUMNS))})"
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+        atexit.register(self.close)
+
+    def _reset(self):
+        # Threads and connections do not survive fork; each process starts its own.
+        self._pid = None
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(self.max_pending)
+        self._thread = None
+        self._pool = queue.LifoQueue()
+
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")  # durable across app crashes; WAL fsyncs at checkpoint
+        return conn
+
+    def _start(self):
+        with self._lock:
+            if self._pid != os.getpid():
+                conn = self._connect()
+                conn.executescript(self.DDL)
+                self._thread = threading.Thread(target=self._run, args=(conn,), name="history-writer", daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    def record(self, m, bodyfat):
+        if not self.path:
+            return
+        if self._pid != os.getpid():
+            self._start()
+        row = (m.subject, time.time(), SEX_NAMES[m.sex], m.age, m.height_cm, m.neck_cm, m.waist_cm,
+               m.hip_cm, m.weight_kg, bodyfat)
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            HISTORY_ROWS.inc("dropped")
+
+    def _run(self, conn):
+        q = self._queue
+        stop = False
+        while not stop:
+            rows = [q.get()]
+            while len(rows) < self.batch:
+                try:
+                    rows.append(q.get_nowait())
+                except queue.Empty:
+                    break
+            if None in rows:  # close() sentinel; it is always the last item
+                rows.remove(None)
+                stop = True
+            if not rows:
+                continue
+            try:
+                conn.execute("BEGIN IMMEDIATE")
+                conn.executemany(self.insert, rows)
+                conn.execute("COMMIT")
+                HISTORY_ROWS.inc("written", n=len(rows))
+            except sqlite3.Error:
+                traceback.print_exc()
+                with contextlib.suppress(sqlite3.Error):
+                    conn.execute("ROLLBACK")
+                HISTORY_ROWS.inc("failed", n=len(rows))
+        conn.close()
+
+    def close(self, timeout=10):
+        # Flush what is queued, then stop this process's writer.
+        if self._pid == os.getpid() and self._thread.is_alive():
+            self._queue.put(None)
+            self._thread.join(timeout)
+        while not self._pool.empty():
+            self._pool.get_nowait().close()
+
+    @contextlib.contextmanager
+    def reader(self):
+        if self._pid != os.getpid():
+            self._start()
+        try:
+            conn = self._pool.get_nowait()
+        except queue.Empty:
+            conn = self._connect()
+            conn.execute("PRAGMA query_only=ON")
+        try:
+            yield conn
+        finally:
+            if self._pool.qsize() < self.readers:
+                self._pool.put(conn)
+            else:
+                conn.close()
+
+    def query(self, subject=None, since=None, until=None, limit=100):
+        # Newest first; served by (subject, ts) or (ts) depending on the filter.
+        if not self.path:
+            return []
+        where, args = [], []
+        if subject is not None:
+            where.append("subject = ?")
+            args.append(subject)
+        if since is not None:
+            where.append("ts >= ?")
+            args.append(since)
+        if until is not None:
+            where.append("ts < ?")
+            args.append(until)
+        sql = f"SELECT {', '.join(self.COLUMNS)} FROM measurements"
+        if where:
+            sql += " WHERE " + " AND ".join(where)
+        sql += " ORDER BY ts DESC LIMIT ?"
+        with self.reader() as conn:
+            return [dict(zip(self.COLUMNS, row)) for row in conn.execute(sql, (*args, limit))]
+
+    def results_after(self, after_id=0):
+        # (id, sex, age, bodyfat) of every row committed after after_id, in id
+        # (= commit) order, for consumers that resume where they stopped.
+        if not self.path or not os.path.exists(self.path):
+            return
+        with self.reader() as conn:
+            yield from conn.execute("SELECT id, sex, age, bodyfat FROM measurements WHERE id > ? ORDER BY id",
+                                    (after_id,))
+
+HISTORY = HistoryStore(os.environ.get("BODYFAT_HISTORY_DB"))  # unset: keep no history
+
+# -------- Reference percentiles (sorted per sex and age band; mmap'd index) --------
+class ReferenceIndex:
+    """Where a result falls in a reference population of earlier results,
+    per sex and age band ("all" covers every age, including unknown). The
+    index file holds, per group, the distinct results in ascending order
+    and the cumulative count up to each, so a lookup is two bisects over a
+    memory-mapped array. update_reference() rebuilds it offline, adding
+    only history rows it has not counted yet, and swaps it in atomically;
+    servers check for a new file every RELOAD seconds."""
+
+    MAGIC = b"BFREF\x00\x01\x00"
+    HEADER = struct.Struct("<8sqI4x")   # magic, last history id counted, groups
+    ENTRY = struct.Struct("<BB2xIQQ")   # sex, band, distinct values, total, offset
+    BANDS = AGE_BANDS[:-1] + ("all",)
+    RELOAD = 30.0
+
+    def __init__(self, path, min_count=30):
+        self.path, self.min_count = path, min_count
+        self.groups, self.last_id, self._stat, self._check_at = {}, 0, None, 0.0
+        self._load()
+
+    def _load(self):
+        self._check_at = time.monotonic() + self.RELOAD
+        try:
+            st = os.stat(self.path)
+        except OSError:
+            self.groups, self.last_id, self._stat = {}, 0, None
+            return
+        stat = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if stat == self._stat:
+            return
+        try:
+            with open(self.path, "rb") as f:
+                mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            magic, last_id, count = self.HEADER.unpack_from(mm)
+            if magic != self.MAGIC:
+                raise ValueError(f"{self.path}: not a reference index")
+            view, groups = memoryview(mm), {}
+            for i in range(count):
+                sex, band, n, total, offset = self.ENTRY.unpack_from(mm, self.HEADER.size + i * self.ENTRY.size)
+                groups[(sex, self.BANDS[band])] = (view[offset:offset + 8 * n].cast("d"),
+                                                   view[offset + 8 * n:offset + 16 * n].cast("Q"), total)
+        except (OSError, ValueError, struct.error):
+            traceback.print_exc()  # keep serving the previous index
+            return
+        # The views keep the mapping alive; the old one goes with its last view.
+        self.groups, self.last_id, self._stat = groups, last_id, stat
+
+    def lookup(self, sex, age, value):
+        # (percentile, band, reference size) for a result, or None when the
+        # group has fewer than min_count results. Ties count half.
+        if time.monotonic() >= self._check_at:
+            self._load()
+        band = age_band(age)
+        group = self.groups.get((sex, "all" if band == "unknown" else band))
+        if group is None or group[2] < self.min_count:
+            return None
+        values, cum, total = group
+        lo = bisect.bisect_left(values, value)
+        hi = bisect.bisect_right(values, value, lo)
+        below = cum[lo - 1] if lo else 0
+        at = (cum[hi - 1] if hi else 0) - below
+        return 100.0 * (below + at / 2) / total, band if band != "unknown" else "all", total
+
+    def counts(self):
+        # {(sex, band): Counter(result -> count)} of the loaded index.
+        out = {}
+        for key, (values, cum, _) in self.groups.items():
+            prev = [0, *cum[:-1]]
+            out[key] = collections.Counter(dict(zip(values, (c - p for c, p in zip(cum, prev)))))
+        return out
+
+    @classmethod
+    def write(cls, path, counts, last_id):
+        groups = sorted((key, c) for key, c in counts.items() if c)
+        offset = cls.HEADER.size + len(groups) * cls.ENTRY.size
+        header, body = [cls.HEADER.pack(cls.MAGIC, last_id, len(groups))], []
+        for (sex, band), c in groups:
+            offset += -offset % 8
+            values = sorted(c)
+            header.append(cls.ENTRY.pack(sex, cls.BANDS.index(band), len(values), sum(c.values()), offset))
+            body.append((offset, array.array("d", values).tobytes()
+                         + array.array("Q", itertools.accumulate(c[v] for v in values)).tobytes()))
+            offset += 16 * len(values)
+        tmp = f"{path}.{os.getpid()}.tmp"
+        with open(tmp, "wb") as f:
+            f.write(b"".join(header))
+            for at, data in body:
+                f.write(b"\0" * (at - f.tell()))
+                f.write(data)
+        os.replace(tmp, path)
+
+def update_reference(path, rows=None, rebuild=False):
+    """Add results to the reference index at ``path``: ``rows`` of (sex,
+    age, bodyfat), or by default the history rows committed since the index
+    was last updated. Returns (rows added, total results in the index)."""
+    ref = ReferenceIndex(path)
+    counts = {} if rebuild else ref.counts()
+    last_id = 0 if rebuild else ref.last_id
+    added = 0
+    for row in HISTORY.results_after(last_id) if rows is None else rows:
+        if rows is None:
+            last_id, *row = row
+        sex, age, bodyfat = row
+        sex = Sex.FEMALE if sex == "female" else Sex.MALE
+        band = age_band(age)
+        for group in {(sex, "all"), (sex, "all" if band == "unknown" else band)}:
+            counts.setdefault(group, collections.Counter())[bodyfat] += 1
+        added += 1
+    ReferenceIndex.write(path, counts, last_id)
+    return added, sum(sum(c.values()) for (_, band), c in counts.items() if band == "all")
+
+def reference_csv_rows(src):
+    # (sex, age, bodyfat) of the scored rows in a `score` output CSV.
+    for row in csv.DictReader(src):
+        bodyfat = parse_float(row.get("bodyfat"))
+        if bodyfat is not None:
+            yield (row.get("sex") or "").strip().lower(), parse_float(row.get("age")), bodyfat
+
+REFERENCE = ReferenceIndex(os.environ.get("BODYFAT_REFERENCE",
+                                          os.path.join(os.path.dirname(os.path.abspath(__file__)), "reference.idx")),
+                           int(os.environ.get("BODYFAT_REFERENCE_MIN", 30)))
+
+def _ordinal(n):
+    suffix = "th" if 10 <= n % 100 <= 20 else {1: "st", 2: "nd", 3: "rd"}.get(n % 10, "th")
+    return f"{n}{suffix}"
+
+def percentile_view(sex, age, value):
+    # The lookup as an API object (None without reference data), with the
+    # sentence the page shows.
+    found = REFERENCE.lookup(sex, age, value)
+    if found is None:
+        return None
+    pct, band, n = found
+    ages = "of all ages" if band == "all" else "under 20" if band == "<20" else f"aged {band}"
+    text = f"{_ordinal(round(pct))} percentile for {'women' if sex == Sex.FEMALE else 'men'} {ages}"
+    return {"value": round(pct, 1), "age_band": band, "n": n, "text": text}
 
-        "hip_unit": request.form.get("hip_unit",""),
-        "hip_val": request.form.get("hip_val",""),
-    }
+def subject_id(s):
+    s = str(s or "").strip()[:64]
+    return s or None
 
+@app.route("/", methods=["GET","POST"])
+def index():
     if request.method == "GET":
-        return render_template_string(PAGE, result=None, error=None, form=form, ranges=RANGES, show_weight=False)
-
-    def parse_float(s):
-        if s in ("", None): return None
-        try: return float(s)
-        except ValueError: return None
-
-    sex = form["sex"] if form["sex"] in ("male","female") else "male"
-
-    # Age (optional but we check range if provided)
-    age = parse_float(form["age"])
-
-    # Height
-    h_unit = form["height_unit"] if form["height_unit"] in ("cm","ftin") else "cm"
-    height_cm = None
-    if h_unit == "cm":
-        height_cm = parse_float(form["height_cm"])
+        return get_page_response()
+
+    timer = PhaseTimer("parse")
+    form = SCHEMA.parse(request.form)
+    result, errors, show_weight, estimates = evaluate(form, timer)
+    timer.enter("render")
+    if not errors:
+        record_result(form, result)
+    if errors:
+        page = render_page(form, errors=[ERRORS[c] for c in errors], show_weight=show_weight)
     else:
-        ft = parse_float(form["height_ft"]) or 0.0
-        inc = parse_float(form["height_in"]) or 0.0
-        total_in = ft*12.0 + inc
-        height_cm = total_in * 2.54 if total_in > 0 else None
-
-    # Weight (optional; not used in calc)
-    weight_unit = form["weight_unit"] if form["weight_unit"] in ("kg","lb") else "kg"
-    weight_val = parse_float(form["weight_val"])
-    weight_kg = None if weight_val is None else (weight_val if weight_unit=="kg" else weight_val*0.45359237)
-
-    # Neck/Waist/Hip
-    neck_cm = None
-    waist_cm = None
-    hip_cm = None
-
-    neck_v = parse_float(form["neck_val"])
-    if neck_v is not None:
-        neck_cm = neck_v if form["neck_unit"] == "cm" else neck_v*2.54
-
-    waist_v = parse_float(form["waist_val"])
-    if waist_v is not None:
-        waist_cm = waist_v if form["waist_unit"] == "cm" else waist_v*2.54
-
-    hip_v = parse_float(form["hip_val"])
-    if hip_v is not None:
-        hip_cm = hip_v if form["hip_unit"] == "cm" else hip_v*2.54
-
-    # Presence checks for formula fields
-    if height_cm is None:
-        return render_template_string(PAGE, result=None, error="Please enter your height.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if neck_cm is None:
-        return render_template_string(PAGE, result=None, error="Please enter your neck circumference.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if waist_cm is None:
-        return render_template_string(PAGE, result=None, error="Please enter your waist circumference.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if sex == "female" and hip_cm is None:
-        return render_template_string(PAGE, result=None, error="Please enter your hip circumference.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-
-    # Range checks (metric)
-    if age is not None and not _in_range_metric("age", age):
-        lo, hi = RANGES["age"];   return render_template_string(PAGE, result=None, error=f"Age must be between {lo} and {hi}.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if not _in_range_metric("height_cm", height_cm):
-        lo, hi = RANGES["height_cm"]; return render_template_string(PAGE, result=None, error=f"Height must be between {lo:.0f} and {hi:.0f} cm.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if not _in_range_metric("neck_cm", neck_cm):
-        lo, hi = RANGES["neck_cm"];   return render_template_string(PAGE, result=None, error=f"Neck must be between {lo:.0f} and {hi:.0f} cm.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if not _in_range_metric("waist_cm", waist_cm):
-        lo, hi = RANGES["waist_cm"];  return render_template_string(PAGE, result=None, error=f"Waist must be between {lo:.0f} and {hi:.0f} cm.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if sex == "female" and not _in_range_metric("hip_cm", hip_cm):
-        lo, hi = RANGES["hip_cm"];    return render_template_string(PAGE, result=None, error=f"Hip must be between {lo:.0f} and {hi:.0f} cm.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if sex == "male" and hip_cm is not None and not _in_range_metric("hip_cm", hip_cm):
-        lo, hi = RANGES["hip_cm"];    return render_template_string(PAGE, result=None, error=f"If provided, hip must be between {lo:.0f} and {hi:.0f} cm.", form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-    if weight_kg is not None and not _in_range_metric("weight_kg", weight_kg):
-        lo, hi = RANGES["weight_kg"]; return render_template_string(PAGE, result=None, error=f"Weight must be between {lo:.0f} and {hi:.0f} kg.", form=form, ranges=RANGES, show_weight=True)
-
-    # Convert to inches for formula
-    height_in = height_cm / 2.54
-    neck_in   = neck_cm / 2.54
-    waist_in  = waist_cm / 2.54
-    hip_in    = None if hip_cm is None else hip_cm / 2.54
-
-    # Compute
-    result, err = navy_bodyfat_percent(sex, height_in, neck_in, waist_in, hip_in)
+        others = [(ESTIMATORS[k].label, f"{v:.2f}") for k, v in estimates.items() if k != PRIMARY_ESTIMATOR]
+        pct = percentile_view(form.sex, form.age, result)
+        page = render_page(form, result=f"{result:.2f}", show_weight=show_weight, estimates=others,
+                           percentile=pct and pct["text"])
+
+    outcome = errors[0] if errors else "ok"
+    timer.finish(outcome)
+    REQUESTS.inc(SEX_NAMES[form.sex], unit_mix(form), outcome)
+    return page
+
+@app.route("/metrics")
+def metrics():
+    return Response(METRICS.render(), mimetype="text/plain; version=0.0.4")
+
+# -------- JSON API --------
+def _api_record(rec):
+    if not isinstance(rec, dict):
+        return {"error": "Each record must be a JSON object."}
+    m = SCHEMA.parse(rec)
+    result, errors, _, estimates = evaluate(m)
+    if errors:
+        return {"error": " ".join(ERRORS[c] for c in errors), "codes": errors}
+    return {"bodyfat": result, "estimates": estimates, "percentile": percentile_view(m.sex, m.age, result)}
+
+def _compact(obj):
+    return json.dumps(obj, separators=(",", ":"))
+
+@app.route("/api/v1/record", methods=["POST"])
+def api_record():
+    # Sent by the page script after each Calculate it has already answered
+    # itself: one record of form fields, scored, counted and recorded exactly
+    # like a form POST (history only with a subject). Returns what the page
+    # adds to its own result: the other estimates and the percentile.
+    rec = request.get_json(silent=True, force=True)
+    if not isinstance(rec, dict):
+        return _json_error("Body must be a JSON object of form fields.")
+    m = SCHEMA.parse(rec)
+    result, errors, _, estimates = evaluate(m)
+    if not errors:
+        record_result(m, result)
+    REQUESTS.inc(SEX_NAMES[m.sex], unit_mix(m), errors[0] if errors else "ok")
+    if errors:
+        return Response(_compact({"error": " ".join(ERRORS[c] for c in errors), "codes": errors}),
+                        status=422, mimetype="application/json")
+    return Response(_compact({"bodyfat": result, "estimates": estimates,
+                              "percentile": percentile_view(m.sex, m.age, result)}), mimetype="application/json")
+
+# Larger batches belong in /api/v1/jobs.
+API_MAX_BYTES = int(os.environ.get("BODYFAT_API_MAX_BYTES", 4 << 20))
+API_MAX_RECORDS = int(os.environ.get("BODYFAT_API_MAX_RECORDS", 10000))
+
+@app.route("/api/v1/bodyfat", methods=["POST"])
+def api_bodyfat():
+    if (request.content_length or 0) > API_MAX_BYTES:
+        return Response(_compact({"error": f"Body is larger than {API_MAX_BYTES >> 20} MB; use /api/v1/jobs."}),
+                        status=413, mimetype="application/json")
+    records = request.get_json(silent=True)
+    if not isinstance(records, list):
+        return Response(_compact({"error": "Body must be a JSON array of measurement records."}),
+                        status=400, mimetype="application/json")
+    if len(records) > API_MAX_RECORDS:
+        return Response(_compact({"error": f"At most {API_MAX_RECORDS} records per request; use /api/v1/jobs."}),
+                        status=413, mimetype="application/json")
+
+    if request.accept_mimetypes.best_match(["application/json", "application/x-ndjson"]) == "application/x-ndjson" \
+            or request.args.get("format") == "ndjson":
+        def lines():
+            for rec in records:
+                yield _compact(_api_record(rec)) + "\n"
+        return Response(lines(), mimetype="application/x-ndjson")
+
+    return Response(_compact([_api_record(rec) for rec in records]), mimetype="application/json")
+
+HISTORY_SECRET = os.environ.get("BODYFAT_HISTORY_SECRET", "")
+
+@app.route("/api/v1/history")
+def api_history():
+    # One subject's rows, for holders of the history secret only; without a
+    # secret configured the endpoint does not exist.
+    token = request.headers.get("X-History-Token", "")
+    if not HISTORY_SECRET or not hmac.compare_digest(token.encode(), HISTORY_SECRET.encode()):
+        return Response(_compact({"error": "Not found."}), status=404, mimetype="application/json")
+    subject = subject_id(request.args.get("subject"))
+    if subject is None:
+        return Response(_compact({"error": "subject is required."}), status=400, mimetype="application/json")
+    try:
+        since, until = (parse_float(request.args.get(k)) for k in ("since", "until"))
+        limit = min(int(request.args.get("limit", 100)), 1000)
+    except ValueError:
+        return Response(_compact({"error": "limit must be an integer."}), status=400, mimetype="application/json")
+    return Response(_compact(HISTORY.query(subject, since, until, limit)), mimetype="application/json")
+
+def stats_snapshot():
+    # One merged summary per (sex, age band) with data; cost is per group,
+    # independent of how many results were observed.
+    groups = []
+    for (sex, band), totals in METRICS.totals(BODYFAT):
+        summary = BODYFAT.summarize(totals)
+        if summary:
+            groups.append({"sex": sex, "age_band": band, **summary})
+    return {"groups": groups, "quantile_resolution": BODYFAT.step}
+
+@app.route("/api/v1/stats")
+def api_stats():
+    return Response(_compact(stats_snapshot()), mimetype="application/json")
+
+def _chart_args(args, names):
+    unit = args.get("unit", "cm")
+    if unit not in CHART_STEPS:
+        raise ValueError("unit must be cm or in.")
+    values = {k: parse_float(args.get(k)) for k in names}
+    missing = [k for k in ("bodyfat", "height", "neck") if k in names and values[k] is None]
+    if missing:
+        raise ValueError(f"Missing or invalid: {', '.join(missing)}.")
+    if values.get("bodyfat") is not None and not BF_CLAMP[0] <= values["bodyfat"] <= BF_CLAMP[1]:
+        raise ValueError(f"bodyfat must be between {BF_CLAMP[0]:g} and {BF_CLAMP[1]:g}.")
+    return ("female" if args.get("sex") == "female" else "male"), unit, values
+
+def _json_error(message):
+    return Response(_compact({"error": message}), status=400, mimetype="application/json")
+
+@app.route("/api/v1/chart")
+def api_chart():
+    try:
+        sex, unit, v = _chart_args(request.args, ("height", "neck"))
+        waist, hip, table = bodyfat_chart(sex, v["height"], v["neck"], unit)
+    except ValueError as e:
+        return _json_error(str(e))
+    cells = [None if c != c else c for c in table.ravel().tolist()]  # NaN -> null
+    if hip is not None:
+        cells = [cells[i:i + len(hip)] for i in range(0, len(cells), len(hip))]
+    return Response(_compact({"unit": unit, "waist": waist.tolist(), "hip": None if hip is None else hip.tolist(),
+                              "bodyfat": cells}), mimetype="application/json")
+
+@app.route("/api/v1/inverse")
+def api_inverse():
+    try:
+        sex, unit, v = _chart_args(request.args, ("bodyfat", "height", "neck", "waist", "hip"))
+    except ValueError as e:
+        return _json_error(str(e))
+    k = 1.0 if unit == "in" else CM_PER_IN
+    inch = {key: None if val is None else val / k for key, val in v.items()}
+    value, err = navy_inverse(sex, v["bodyfat"], inch["height"], inch["neck"],
+                              inch["waist"] if sex == "female" else None, inch["hip"] if sex == "female" else None)
     if err:
-        return render_template_string(PAGE, result=None, error=err, form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-
-    return render_template_string(PAGE, result=f"{max(-5.0, min(75.0, result)):.2f}", error=None, form=form, ranges=RANGES, show_weight=(weight_kg is not None))
-
-if __name__ == "__main__":
+        return _json_error(err)
+    solved = "hip" if sex == "female" and v["waist"] is not None else "waist"
+    lo, hi = RANGES[f"{solved}_cm"]
+    if not lo <= value * CM_PER_IN <= hi:
+        return _json_error(f"That body fat needs a {solved} outside {lo:.0f}-{hi:.0f} cm.")
+    return Response(_compact({solved: round(value * k, 2), "unit": unit}), mimetype="application/json")
+
+# -------- Readiness and cold-start profile --------
+@app.route("/readyz")
+def readyz():
+    # Everything a request needs is built at import, so answering at all
+    # means the instance is warm.
+    return Response(_compact({"status": "ready", "init_ms": round(INIT_MS, 1), "warm_at": WARM_AT, "pid": os.getpid()}),
+                    mimetype="application/json")
+
+def _import_times(here):
+    # Cumulative import time (ms) per module from `python -X importtime`.
+    out = subprocess.run([sys.executable, "-X", "importtime", "-c", "import main"],
+                         cwd=here, capture_output=True, text=True, check=True).stderr
+    times = {}
+    for line in out.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit():
+            times.setdefault(parts[2].strip(), (int(parts[0].split(":")[1]) / 1000, int(parts[1]) / 1000))
+    return times
+
+def _first_response_ms(here, port):
+    # Start the production server with one worker and time until GET / answers.
+    t0 = time.perf_counter()
+    proc = subprocess.Popen([sys.executable, os.path.join(here, "main.py"), "serve", "--workers", "1",
+                             "--port", str(port), "--host", "127.0.0.1"],
+                            stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            try:
+                with socket.create_connection(("127.0.0.1", port), timeout=1) as sock:
+                    sock.sendall(b"GET / HTTP/1.1\r\nHost: localhost\r\nConnection: close\r\n\r\n")
+                    if sock.recv(12).startswith(b"HTTP/1.1 200"):
+                        return (time.perf_counter() - t0) * 1000
+            except OSError:
+                if proc.poll() is not None:
+                    raise RuntimeError("server exited during startup")
+                time.sleep(0.005)
+    finally:
+        proc.terminate()
+        proc.wait()
+
+def startup_profile(runs=3, budget_ms=None, out=None):
+    out = out or sys.stderr
+    here = os.path.dirname(os.path.abspath(__file__))
+    times = _import_times(here)
+    for name in ("flask", "jinja2", "werkzeug", "numpy"):
+        if name in times:
+            print(f"import {name:10s} {times[name][1]:8.1f} ms", file=out)
+        else:
+            print(f"import {name:10s}      (not imported)", file=out)
+    self_ms, total_ms = times["main"]
+    print(f"app init (main self) {self_ms:6.1f} ms   main total {total_ms:.1f} ms", file=out)
+
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+    samples = sorted(_first_response_ms(here, port) for _ in range(runs))
+    median = samples[len(samples) // 2]
+    print(f"time to first response: median {median:.0f} ms over {runs} runs "
+          f"(min {samples[0]:.0f}, max {samples[-1]:.0f})", file=out)
+    if budget_ms is not None and median > budget_ms:
+        print(f"over budget: {median:.0f} ms > {budget_ms:.0f} ms", file=out)
+        return False
+    return True
+
+# -------- Request profiling (opt-in; collapsed stacks for flame graphs) --------
+class _StackRecorder:
+    # sys.setprofile hook for one thread: charges the time between events to
+    # the current call stack, kept as node ids in a trie so each event costs
+    # a dict lookup rather than building a tuple of the whole stack.
+    def __init__(self):
+        self.nodes = {}           # (parent id, frame name) -> id
+        self.paths = [()]         # id -> (parent id, frame name); id 0 is the root
+        self.ns = [0]             # id -> self time in ns
+        self.stack = [0]
+        self.names = {}           # code object -> frame name
+        self.t = time.perf_counter_ns()
+
+    def _name(self, code):
+        name = f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+        self.names[code] = name = name.replace(";", ":")
+        return name
+
+    def __call__(self, frame, event, arg):
+        now = time.perf_counter_ns()
+        stack = self.stack
+        self.ns[stack[-1]] += now - self.t
+        if event == "call" or event == "c_call":
+            if event == "call":
+                name = self.names.get(frame.f_code) or self._name(frame.f_code)
+            else:  # builtins; bound ones are new objects per call, so not cached
+                name = f"{getattr(arg, '__module__', None) or 'builtins'}.{getattr(arg, '__qualname__', '?')}"
+            node = self.nodes.get((stack[-1], name))
+            if node is None:
+                node = self.nodes[(stack[-1], name)] = len(self.paths)
+                self.paths.append((stack[-1], name))
+                self.ns.append(0)
+            stack.append(node)
+        elif len(stack) > 1:  # return, c_return, c_exception; ignore frames entered before start
+            stack.pop()
+        self.t = time.perf_counter_ns()
+
+    def collapsed(self):
+        # "outer;inner;leaf <microseconds>" per stack with self time: the
+        # input format of flamegraph.pl, inferno and speedscope.
+        lines = []
+        for node in range(1, len(self.paths)):
+            us = self.ns[node] // 1000
+            if us:
+                frames, n = [], node
+                while n:
+                    n, name = self.paths[n]
+                    frames.append(name)
+                lines.append(f"{';'.join(reversed(frames))} {us}")
+        return "\n".join(lines) + "\n"
+
+class Profiler:
+    """WSGI middleware that records a full call profile of selected requests:
+    a random ``rate`` fraction of them, or any request whose X-Profile-Token
+    header matches ``secret``. Each profile is written to ``directory`` as
+    collapsed stacks (<time>-<pid>-<seq>-<path>.folded, named in the
+    response's X-Profile-Id header); only the newest ``keep`` files are kept.
+    Only the call into the app is profiled; a streamed body is not.
+
+    Stacks are recorded exactly with sys.setprofile on the request's own
+    thread: requests last about a millisecond, below the GIL switch
+    interval a sampling thread could resolve, and cProfile keeps only
+    caller/callee pairs, not whole stacks. Unprofiled requests cost one
+    header lookup; with neither rate nor secret set, nothing is installed."""
+
+    def __init__(self, wsgi_app, directory, rate=0.0, secret="", keep=200):
+        self.app, self.directory, self.rate, self.secret, self.keep = wsgi_app, directory, rate, secret, keep
+        self.seq = itertools.count()
+
+    def _selected(self, environ):
+        token = environ.get("HTTP_X_PROFILE_TOKEN")
+        if token is not None and self.secret:
+            return hmac.compare_digest(token.encode(), self.secret.encode())
+        return self.rate > 0 and random.random() < self.rate
+
+    def __call__(self, environ, start_response):
+        if not self._selected(environ):
+            return self.app(environ, start_response)
+        path = re.sub(r"[^A-Za-z0-9]+", "_", environ.get("PATH_INFO", "")).strip("_") or "root"
+        profile_id = f"{time.time_ns()}-{os.getpid()}-{next(self.seq)}-{path[:40]}"
+
+        def tagged(status, headers, exc_info=None):
+            return start_response(status, [*headers, ("X-Profile-Id", profile_id)], exc_info)
+
+        recorder = _StackRecorder()
+        sys.setprofile(recorder)
+        try:
+            return self.app(environ, tagged)
+        finally:
+            sys.setprofile(None)
+            self._save(profile_id, recorder.collapsed())
+
+    def _save(self, profile_id, text):
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = os.path.join(self.directory, f"{profile_id}.folded")
+            with open(f"{path}.tmp", "w") as f:
+                f.write(text)
+            os.replace(f"{path}.tmp", path)
+            # Names start with the time in ns, so sorting puts the oldest first.
+            ring = sorted(n for n in os.listdir(self.directory) if n.endswith(".folded"))
+            for name in ring[:max(0, len(ring) - self.keep)]:
+                with contextlib.suppress(OSError):
+                    os.unlink(os.path.join(self.directory, name))
+        except OSError:
+            traceback.print_exc()
+
+PROFILE_RATE = float(os.environ.get("BODYFAT_PROFILE_RATE", 0))
+PROFILE_SECRET = os.environ.get("BODYFAT_PROFILE_SECRET", "")
+if PROFILE_RATE > 0 or PROFILE_SECRET:
+    PROFILE_DIR = os.environ.get("BODYFAT_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "bodyfat-profiles"))
+    app.wsgi_app = Profiler(app.wsgi_app, PROFILE_DIR, PROFILE_RATE, PROFILE_SECRET,
+                            int(os.environ.get("BODYFAT_PROFILE_KEEP", 200)))
+
+# -------- Bulk CSV scoring (streaming, bounded memory) --------
+def _read_chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _score_chunks(chunks, observe=False):
+    # observe: feed scored rows into the BODYFAT stats (score --stats).
+    # Chunks go through the batch engine, which agrees with evaluate()
+    # exactly; without NumPy, row by row.
+    try:
+        _require_numpy()
+    except RuntimeError:
+        yield from _score_rows(chunks, observe)
+        return
+    messages = {0: ""}
+    for chunk in chunks:
+        cols = SCHEMA.normalize_columns(SCHEMA.entered_columns(chunk))
+        result, mask, _ = evaluate_batch(cols)
+        masks = mask.tolist()
+        for row, r, bits in zip(chunk, result.tolist(), masks):
+            if bits not in messages:
+                messages[bits] = " ".join(ERRORS[c] for c in error_codes(bits))
+            row["bodyfat"] = "" if bits else f"{r:.2f}"
+            row["error"] = messages[bits]
+        if observe:
+            for sex, age, r, bits in zip(cols.sex.tolist(), cols.age.tolist(), result.tolist(), masks):
+                if not bits:
+                    BODYFAT.observe((SEX_NAMES[sex], age_band(None if math.isnan(age) else age)), r)
+        yield chunk
+
+def _score_rows(chunks, observe=False):
+    for chunk in chunks:
+        for row in chunk:
+            m = SCHEMA.parse(row)
+            result, errors, _, _ = evaluate(m)
+            if observe and not errors:
+                BODYFAT.observe((SEX_NAMES[m.sex], age_band(m.age)), result)
+            row["bodyfat"] = "" if errors else f"{result:.2f}"
+            row["error"] = " ".join(ERRORS[c] for c in errors)
+        yield chunk
+
+def score_csv(src, dst, chunk_size=10000, workers=1, observe=False):
+    # CSV columns use the form field names (sex, height_unit, height_cm, ...).
+    if workers > 1:
+        return _score_csv_parallel(src, dst, chunk_size, workers, observe)
+    reader = csv.DictReader(src)
+    fields = _output_fields(reader.fieldnames)
+    writer = csv.DictWriter(dst, fieldnames=fields, extrasaction="ignore")
+    writer.writeheader()
+    rows = errors = 0
+    for chunk in _score_chunks(_read_chunks(reader, chunk_size), observe):
+        writer.writerows(chunk)
+        rows += len(chunk)
+        errors += sum(1 for r in chunk if r["error"])
+    return rows, errors
+
+def _output_fields(fieldnames):
+    return [f for f in (fieldnames or []) if f not in ("bodyfat", "error")] + ["bodyfat", "error"]
+
+# -------- Bulk scoring jobs (background pool; state on disk, shared by all workers) --------
+class JobQueue:
+    """Uploaded CSVs scored in the background. Each job is a directory under
+    ``root`` holding the input, the output and status.json (replaced
+    atomically), so any forked worker can answer polls and downloads for a
+    job another one is running. Each process scores on its own bounded
+    thread pool and takes at most ``max_queued`` jobs at a time; finished
+    jobs are deleted ``ttl`` seconds after they end."""
+
+    ID = re.compile(r"[0-9a-f]{32}")
+    CHUNK_ROWS = 5000
+
+    def __init__(self, root, workers=1, max_queued=8, ttl=3600, max_bytes=256 << 20):
+        self.root, self.workers, self.max_queued, self.ttl, self.max_bytes = root, workers, max_queued, ttl, max_bytes
+        self._reset()
+        os.register_at_fork(after_in_child=self._reset)
+
+    def _reset(self):
+        self._pool = None
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._stop = threading.Event()
+        self._swept = 0.0
+
+    def _dir(self, job_id):
+        return os.path.join(self.root, job_id)
+
+    def _write(self, job_id, status):
+        path = os.path.join(self._dir(job_id), "status.json")
+        with open(f"{path}.{threading.get_ident()}", "w") as f:
+            json.dump(status, f)
+        os.replace(f"{path}.{threading.get_ident()}", path)
+
+    def status(self, job_id):
+        if not self.ID.fullmatch(job_id):
+            return None
+        self.sweep()
+        try:
+            with open(os.path.join(self._dir(job_id), "status.json")) as f:
+                status = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if status["state"] in ("queued", "running") and not _pid_alive(status["pid"]):
+            status.update(state="failed", error="The worker scoring this job exited.",
+                          finished=time.time(), expires=time.time() + self.ttl)
+            self._write(job_id, status)
+        return status
+
+    def submit(self, stream):
+        """Copy an uploaded CSV to disk and queue it. Returns the new status,
+        or None when this process already has max_queued jobs."""
+        with self._lock:
+            if self._pending >= self.max_queued:
+                JOB_OUTCOMES.inc("rejected")
+                return None
+            self._pending += 1
+            if self._pool is None:
+                self._pool = concurrent.futures.ThreadPoolExecutor(self.workers, thread_name_prefix="job")
+                JOB_WORKERS.inc(n=self.workers)
+        job_id = uuid.uuid4().hex
+        try:
+            os.makedirs(self._dir(job_id))
+            rows = self._save_input(stream, os.path.join(self._dir(job_id), "input.csv"))
+        except BaseException:
+            with self._lock:
+                self._pending -= 1
+            shutil.rmtree(self._dir(job_id), ignore_errors=True)
+            raise
+        status = {"id": job_id, "state": "queued", "rows_total": rows, "rows_done": 0, "errors": 0,
+                  "created": time.time(), "pid": os.getpid()}
+        self._write(job_id, status)
+        JOBS_QUEUED.inc()
+        self._pool.submit(self._run, dict(status))  # the job thread updates its own copy
+        self.sweep()
+        return status
+
+    def _save_input(self, stream, path):
+        # Returns the number of data rows (lines after the header).
+        size = lines = 0
+        last = b"\n"
+        with open(path, "wb") as f:
+            while block := stream.read(1 << 16):
+                size += len(block)
+                if size > self.max_bytes:
+                    raise ValueError(f"Upload is larger than {self.max_bytes >> 20} MB.")
+                f.write(block)
+                lines += block.count(b"\n")
+                last = block[-1:]
+        lines += last != b"\n"
+        if lines < 2:
+            raise ValueError("Upload must be a CSV with a header row and at least one record.")
+        return lines - 1
+
+    def _run(self, status):
+        job_id = status["id"]
+        JOBS_QUEUED.dec()
+        JOBS_RUNNING.inc()
+        t0 = time.perf_counter()
+        status.update(state="running", started=time.time())
+        self._write(job_id, status)
+        d = self._dir(job_id)
+        try:
+            with open(os.path.join(d, "input.csv"), newline="") as src, \
+                    open(os.path.join(d, "output.tmp"), "w", newline="") as dst:
+                reader = csv.DictReader(src)
+                writer = csv.DictWriter(dst, fieldnames=_output_fields(reader.fieldnames), extrasaction="ignore")
+                writer.writeheader()
+                for chunk in _score_chunks(_read_chunks(reader, self.CHUNK_ROWS)):
+                    if self._stop.is_set():
+                        raise RuntimeError("The server shut down before the job finished.")
+                    writer.writerows(chunk)
+                    status["rows_done"] += len(chunk)
+                    status["errors"] += sum(1 for r in chunk if r["error"])
+                    JOB_ROWS.inc(n=len(chunk))
+                    self._write(job_id, status)
+            os.replace(os.path.join(d, "output.tmp"), os.path.join(d, "output.csv"))
+            status["state"] = "done"
+        except Exception as e:
+            traceback.print_exc()
+            status.update(state="failed", error=str(e) or type(e).__name__)
+        finally:
+            status.update(finished=time.time(), expires=time.time() + self.ttl)
+            with contextlib.suppress(OSError):
+                self._write(job_id, status)
+            JOB_OUTCOMES.inc(status["state"])
+            JOBS_RUNNING.dec()
+            JOB_BUSY.inc(n=time.perf_counter() - t0)
+            with self._lock:
+                self._pending -= 1
+
+    def result_path(self, job_id):
+        return os.path.join(self._dir(job_id), "output.csv")
+
+    def sweep(self, now=None):
+        # Drop expired jobs; runs at most once a minute per process.
+        now = now or time.time()
+        if now - self._swept < 60:
+            return
+        self._swept = now
+        with contextlib.suppress(OSError):
+            for job_id in os.listdir(self.root):
+                try:
+                    with open(os.path.join(self._dir(job_id), "status.json")) as f:
+                        expires = json.load(f).get("expires")
+                except (OSError, ValueError):
+                    continue
+                if expires and expires < now:
+                    shutil.rmtree(self._dir(job_id), ignore_errors=True)
+
+    def stop(self):
+        # Running jobs stop at their next chunk and are marked failed; event
+        # streams end. Set before draining requests, so neither holds it up.
+        self._stop.set()
+
+    def stopped(self, timeout=0):
+        return self._stop.wait(timeout)
+
+    def close(self):
+        self.stop()
+        if self._pool is not None:
+            self._pool.shutdown(wait=True, cancel_futures=True)
+
+JOB_QUEUE = JobQueue(os.environ.get("BODYFAT_JOBS_DIR", os.path.join(tempfile.gettempdir(), "bodyfat-jobs")),
+                     workers=int(os.environ.get("BODYFAT_JOB_WORKERS", 1)),
+                     max_queued=int(os.environ.get("BODYFAT_JOB_QUEUE", 8)),
+                     ttl=float(os.environ.get("BODYFAT_JOB_TTL", 3600)))
+JOB_EVENTS_MAX_SECONDS = float(os.environ.get("BODYFAT_JOB_EVENTS_MAX", 120))
+
+def _job_links(job_id):
+    base = f"/api/v1/jobs/{job_id}"
+    return {"status_url": base, "events_url": f"{base}/events", "result_url": f"{base}/result"}
+
+def _job_view(status):
+    view = {k: v for k, v in status.items() if k != "pid"}
+    view["progress"] = round(status["rows_done"] / status["rows_total"], 4) if status["rows_total"] else 1.0
+    return {**view, **_job_links(status["id"])}
+
+def _job_not_found():
+    return Response(_compact({"error": "No such job (it may have expired)."}), status=404, mimetype="application/json")
+
+@app.route("/api/v1/jobs", methods=["POST"])
+def api_job_submit():
+    # Body: the CSV itself, or a multipart form with a "file" field.
+    upload = request.files.get("file")
+    try:
+        status = JOB_QUEUE.submit(upload.stream if upload else request.stream)
+    except ValueError as e:
+        return _json_error(str(e))
+    if status is None:
+        return Response(_compact({"error": "Too many jobs queued; try again shortly."}), status=503,
+                        headers={"Retry-After": "30"}, mimetype="application/json")
+    return Response(_compact(_job_view(status)), status=202, headers={"Location": f"/api/v1/jobs/{status['id']}"},
+                    mimetype="application/json")
+
+@app.route("/api/v1/jobs/<job_id>")
+def api_job_status(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return _job_not_found()
+    return Response(_compact(_job_view(status)), mimetype="application/json")
+
+@app.route("/api/v1/jobs/<job_id>/events")
+def api_job_events(job_id):
+    # Server-sent events: one "data:" message per status change until the job
+    # ends. A stream lasts at most JOB_EVENTS_MAX_SECONDS (or until shutdown);
+    # EventSource clients reconnect by themselves after the retry delay.
+    if JOB_QUEUE.status(job_id) is None:
+        return _job_not_found()
+
+    def events():
+        yield "retry: 1000\n\n"
+        last, idle, deadline = None, 0.0, time.monotonic() + JOB_EVENTS_MAX_SECONDS
+        while time.monotonic() < deadline:
+            status = JOB_QUEUE.status(job_id)
+            if status is None:
+                yield "event: expired\ndata: {}\n\n"
+                return
+            if status != last:
+                yield f"data: {_compact(_job_view(status))}\n\n"
+                last, idle = status, 0.0
+            if status["state"] in ("done", "failed"):
+                return
+            if idle >= 15:
+                yield ": keep-alive\n\n"
+                idle = 0.0
+            if JOB_QUEUE.stopped(0.5):
+                return
+            idle += 0.5
+
+    return Response(events(), mimetype="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.route("/api/v1/jobs/<job_id>/result")
+def api_job_result(job_id):
+    status = JOB_QUEUE.status(job_id)
+    if status is None:
+        return _job_not_found()
+    if status["state"] != "done":
+        return Response(_compact({"error": f"Job is {status['state']}.", **_job_view(status)}), status=409,
+                        mimetype="application/json")
+    return send_file(JOB_QUEUE.result_path(job_id), mimetype="text/csv", as_attachment=True,
+                     download_name=f"bodyfat-{job_id}.csv", max_age=0)
+
+# -------- Parallel bulk scoring (process pool) --------
+def pool_size(workers=None):
+    return workers or os.cpu_count() or 1
+
+class WorkerStats:
+    def __init__(self):
+        self.by_pid = {}
+
+    def add(self, pid, rows, secs):
+        r, t = self.by_pid.get(pid, (0, 0.0))
+        self.by_pid[pid] = (r + rows, t + secs)
+
+    def report(self, out=None):
+        for pid, (rows, secs) in sorted(self.by_pid.items()):
+            rate = rows / secs if secs else 0.0
+            print(f"worker {pid}: {rows} rows in {secs:.2f}s ({rate:,.0f} rows/s)", file=out or sys.stderr)
+
+def _ordered_map(ex, fn, items, window):
+    # Like ex.map, but keeps at most `window` shards in flight so a huge
+    # input never gets queued into memory all at once. Output order = input order.
+    pending = collections.deque()
+    for item in items:
+        pending.append(ex.submit(fn, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
+
+def _csv_shard_worker(shard):
+    header, lines, observe = shard
+    t0 = time.perf_counter()
+    reader = csv.DictReader(io.StringIO(header + "".join(lines)))
+    out = io.StringIO()
+    writer = csv.DictWriter(out, fieldnames=_output_fields(reader.fieldnames), extrasaction="ignore")
+    rows = errors = 0
+    for chunk in _score_chunks([list(reader)], observe):
+        writer.writerows(chunk)
+        rows += len(chunk)
+        errors += sum(1 for r in chunk if r["error"])
+    return out.getvalue(), rows, errors, os.getpid(), time.perf_counter() - t0
+
+def _score_csv_parallel(src, dst, chunk_size, workers, observe=False):
+    # Shards travel as raw text and come back as one CSV string each, so
+    # nothing is pickled per row. Records must not contain embedded newlines.
+    header = src.readline()
+    csv.writer(dst).writerow(_output_fields(next(csv.reader([header]), [])))
+    stats = WorkerStats()
+    rows = errors = 0
+    with concurrent.futures.ProcessPoolExecutor(workers) as ex:
+        shards = ((header, lines, observe) for lines in _read_chunks(src, chunk_size))
+        for text, n, e, pid, secs in _ordered_map(ex, _csv_shard_worker, shards, 2 * workers):
+            dst.write(text)
+            rows += n
+            errors += e
+            stats.add(pid, n, secs)
+    stats.report()
+    return rows, errors
+
+# -------- Columnar dataset files (fixed-width, memory-mapped) --------
+# Layout: a header (magic, row count, column count), one directory entry per
+# column (name, dtype, offset, length) and the columns themselves, each
+# starting on a COLUMN_ALIGN boundary. Values are little-endian "<f4"/"<f8"
+# floats (NaN = missing), "<u2" error masks, or "bits" (one bit per row,
+# LSB first; sex: 1 = female, like Sex).
+COLUMN_MAGIC = b"BFCOL\x00\x01\x00"
+_COLUMN_HEADER = struct.Struct("<8sQI4x")
+_COLUMN_ENTRY = struct.Struct("<16s4sQQ")
+COLUMN_ALIGN = 64
+PACKED_FIELDS = ("height_cm", "neck_cm", "waist_cm", "hip_cm", "age", "weight_kg")  # metric, as in RANGES
+
+def _column_nbytes(dtype, rows):
+    return (rows + 7) // 8 if dtype == "bits" else rows * int(dtype[2:])
+
+class ColumnFile:
+    """A columnar dataset opened through mmap, read-only unless ``writable``.
+    ``f[name]`` is a zero-copy NumPy view of one column (packed bytes for
+    "bits" columns); measurements() hands a row range to the batch engine as
+    MeasurementColumns without per-row objects."""
+
+    def __init__(self, path, writable=False):
+        _require_numpy()
+        with open(path, "r+b" if writable else "rb") as f:
+            self._mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_WRITE if writable else mmap.ACCESS_READ)
+        self.writable = writable
+        magic, self.rows, count = _COLUMN_HEADER.unpack_from(self._mm)
+        if magic != COLUMN_MAGIC:
+            self._mm.close()
+            raise ValueError(f"{path}: not a columnar dataset file")
+        self.columns = {}
+        for i in range(count):
+            entry = _COLUMN_HEADER.size + i * _COLUMN_ENTRY.size
+            name, dtype, offset, nbytes = _COLUMN_ENTRY.unpack_from(self._mm, entry)
+            self.columns[name.rstrip(b"\0").decode()] = (dtype.rstrip(b"\0").decode(), offset, nbytes)
+
+    def __getitem__(self, name):
+        dtype, offset, nbytes = self.columns[name]
+        if dtype == "bits":
+            return np.frombuffer(self._mm, np.uint8, count=nbytes, offset=offset)
+        return np.frombuffer(self._mm, dtype, count=self.rows, offset=offset)
+
+    def bits(self, name, start=0, stop=None):
+        # Rows start..stop of a "bits" column as uint8 0/1; start must be a multiple of 8.
+        stop = self.rows if stop is None else stop
+        packed = self[name][start // 8:(stop + 7) // 8]
+        return np.unpackbits(packed, count=stop - start, bitorder="little")
+
+    def measurements(self, start=0, stop=None):
+        # float64 columns are views into the mapping; float32 ones are widened
+        # (a copy of just this range) so scores match the float64 path's math.
+        stop = self.rows if stop is None else stop
+        cols = MeasurementColumns.__new__(MeasurementColumns)
+        for key in PACKED_FIELDS:
+            setattr(cols, key, self[key][start:stop].astype(np.float64, copy=False))
+        cols.sex = self.bits("sex", start, stop)
+        return cols
+
+    def close(self):
+        # Views handed out keep the mapping alive; it is unmapped when the last one goes.
+        if self.writable and not self._mm.closed:
+            self._mm.flush()
+        with contextlib.suppress(BufferError):
+            self._mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ColumnWriter:
+    """Creates a columnar dataset of a known row count: the file is sized up
+    front and ``w[name]`` is a writable view of a column inside its mapping.
+    The file is written under a temporary name and renamed into place by
+    close(), so readers never see a partial file."""
+
+    def __init__(self, path, columns, rows):
+        _require_numpy()
+        self.path, self.rows, self.columns = path, rows, {}
+        offset = _COLUMN_HEADER.size + len(columns) * _COLUMN_ENTRY.size
+        header = [_COLUMN_HEADER.pack(COLUMN_MAGIC, rows, len(columns))]
+        for name, dtype in columns:
+            offset = -(-offset // COLUMN_ALIGN) * COLUMN_ALIGN
+            nbytes = _column_nbytes(dtype, rows)
+            self.columns[name] = (dtype, offset, nbytes)
+            header.append(_COLUMN_ENTRY.pack(name.encode(), dtype.encode(), offset, nbytes))
+            offset += nbytes
+        self._tmp = f"{path}.{os.getpid()}.tmp"
+        with open(self._tmp, "wb+") as f:
+            f.truncate(max(offset, 1))
+            self._mm = mmap.mmap(f.fileno(), 0)
+        header = b"".join(header)
+        self._mm[:len(header)] = header
+
+    def __getitem__(self, name):
+        dtype, offset, nbytes = self.columns[name]
+        if dtype == "bits":
+            return np.frombuffer(self._mm, np.uint8, count=nbytes, offset=offset)
+        return np.frombuffer(self._mm, dtype, count=self.rows, offset=offset)
+
+    def fill(self, name, src):
+        # Copy a column's bytes from a file object straight into the mapping.
+        _, offset, nbytes = self.columns[name]
+        view = memoryview(self._mm)[offset:offset + nbytes]
+        try:
+            done = 0
+            while done < nbytes:
+                n = src.readinto(view[done:done + (8 << 20)])
+                if not n:
+                    raise ValueError(f"column {name}: expected {nbytes} bytes, got {done}")
+                done += n
+        finally:
+            view.release()
+
+    def close(self, commit=True):
+        if self._mm is None:
+            return
+        self._mm.flush()
+        with contextlib.suppress(BufferError):
+            self._mm.close()
+        self._mm = None
+        if commit:
+            os.replace(self._tmp, self.path)
+        else:
+            with contextlib.suppress(OSError):
+                os.unlink(self._tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, *exc):
+        self.close(commit=exc_type is None)
+
+def pack_csv(src, dst_path, float32=False, chunk_rows=65536):
+    """Convert a measurement CSV (form field names, any units) into a
+    columnar dataset of metric PACKED_FIELDS plus a bit-packed sex column.
+    Chunks are converted by SCHEMA.normalize_columns, which matches parse()
+    exactly; each column is spooled to a temporary file so memory stays
+    bounded by the chunk."""
+    _require_numpy()
+    chunk_rows = max(8, chunk_rows // 8 * 8)  # whole bytes of sex bits per chunk
+    dtype = "<f4" if float32 else "<f8"
+    spool_dir = os.path.dirname(os.path.abspath(dst_path))
+    with contextlib.ExitStack() as stack:
+        spools = {key: stack.enter_context(tempfile.TemporaryFile(dir=spool_dir)) for key in (*PACKED_FIELDS, "sex")}
+        rows = 0
+        for chunk in _read_chunks(csv.DictReader(src), chunk_rows):
+            cols = SCHEMA.normalize_columns(SCHEMA.entered_columns(chunk))
+            for key in PACKED_FIELDS:
+                spools[key].write(getattr(cols, key).astype(dtype).tobytes())
+            # Chunks are multiples of 8 rows (but the last), so packed bytes concatenate.
+            spools["sex"].write(np.packbits(cols.sex, bitorder="little").tobytes())
+            rows += len(chunk)
+        with ColumnWriter(dst_path, [(key, dtype) for key in PACKED_FIELDS] + [("sex", "bits")], rows) as out:
+            for key, f in spools.items():
+                f.seek(0)
+                out.fill(key, f)
+    return rows
+
+def _score_packed_range(spec):
+    # Score rows start..stop of src into the (already sized) results file at
+    # out; both are mapped, so pool workers write their rows in place.
+    src_path, out_path, start, stop, chunk_rows = spec
+    t0 = time.perf_counter()
+    errors = 0
+    with ColumnFile(src_path) as src, ColumnFile(out_path, writable=True) as dst:
+        out = {name: dst[name] for name in dst.columns}
+        for lo in range(start, stop, chunk_rows):
+            hi = min(stop, lo + chunk_rows)
+            _, mask, estimates = evaluate_batch(src.measurements(lo, hi))
+            for name, values in estimates.items():
+                out[name][lo:hi] = values
+            out["error"][lo:hi] = mask
+            errors += int(np.count_nonzero(mask))
+        del out
+    return os.getpid(), stop - start, errors, time.perf_counter() - t0
+
+def score_packed(src_path, dst_path, chunk_rows=1 << 20, workers=1):
+    """Score a columnar dataset into a columnar results file: one "<f8"
+    column per estimator (NaN where it does not apply or the row is
+    invalid) and an "<u2" ``error`` column of ERROR_BITS. Works through
+    mapped row ranges, so memory is bounded by chunk_rows, not the file.
+    With workers > 1, ranges are scored by a process pool; each worker maps
+    the input and the output file itself, so only file names and row bounds
+    are pickled."""
+    chunk_rows = max(8, chunk_rows // 8 * 8)
+    with ColumnFile(src_path) as src:
+        n = src.rows
+    columns = [(name, "<f8") for name in ESTIMATORS] + [("error", "<u2")]
+    errors = 0
+    with ColumnWriter(dst_path, columns, n) as dst:
+        shard = chunk_rows if workers <= 1 else max(8, min(chunk_rows, (-(-n // workers) + 7) // 8 * 8))
+        specs = [(src_path, dst._tmp, lo, min(n, lo + shard), chunk_rows) for lo in range(0, n, shard)]
+        if workers > 1 and len(specs) > 1:
+            stats = WorkerStats()
+            with concurrent.futures.ProcessPoolExecutor(min(workers, len(specs))) as ex:
+                for pid, rows, e, secs in ex.map(_score_packed_range, specs):
+                    errors += e
+                    stats.add(pid, rows, secs)
+            stats.report()
+        else:
+            for spec in specs:
+                errors += _score_packed_range(spec)[2]
+    return n, errors
+
+def _open_csv(path, mode):
+    if path == "-":
+        return contextlib.nullcontext(sys.stdin if mode == "r" else sys.stdout)
+    return open(path, mode, newline="", encoding="utf-8")
+
+# Chart cells are clamped hundredths, so formatting is a table lookup
+# (index = hundredths - lo; the extra last entry is NaN -> "").
+_CELL_TEXT = [f"{i / 100:.2f}" for i in range(round(BF_CLAMP[0] * 100), round(BF_CLAMP[1] * 100) + 1)] + [""]
+
+def _chart_csv(unit, waist, hip, table):
+    cells = np.rint(np.nan_to_num(table, nan=BF_CLAMP[1] + 0.01) * 100).astype(np.int64) - round(BF_CLAMP[0] * 100)
+    text = _CELL_TEXT.__getitem__
+    if hip is None:
+        lines = [f"waist_{unit},bodyfat"] + [f"{w:g},{text(c)}" for w, c in zip(waist.tolist(), cells.tolist())]
+    else:
+        lines = [f"waist_{unit}\\hip_{unit}," + ",".join(f"{h:g}" for h in hip.tolist())]
+        lines += [f"{w:g}," + ",".join(map(text, row)) for w, row in zip(waist.tolist(), cells.tolist())]
+    return "\n".join(lines) + "\n"
+
+def write_charts(src, outdir, unit="cm"):
+    # One chart CSV per input row (columns: subject, sex, height, neck in
+    # `unit`); rows are grouped by sex so each group is scored in bulk.
+    rows = list(csv.DictReader(src))
+    os.makedirs(outdir, exist_ok=True)
+    for sex in ("male", "female"):
+        idx = [i for i, r in enumerate(rows) if (r.get("sex") == "female") == (sex == "female")]
+        if not idx:
+            continue
+        height = [float(rows[i]["height"]) for i in idx]
+        neck = [float(rows[i]["neck"]) for i in idx]
+        waist = chart_axis("waist_cm", unit)
+        hip = None if sex == "male" else chart_axis("hip_cm", unit)
+        for start, tables in iter_charts(sex, height, neck, unit):
+            for i, table in zip(idx[start:], tables):
+                name = "".join(c if c.isalnum() or c in "-_" else "_" for c in rows[i].get("subject") or "")
+                with open(os.path.join(outdir, f"{i:06d}{'-' + name if name else ''}.csv"), "w") as f:
+                    f.write(_chart_csv(unit, waist, hip, table))
+    return len(rows)
+
+# -------- Production server (pre-forked, threaded, keep-alive) --------
+class _KeepAliveHandler(WSGIRequestHandler):
+    # werkzeug's handler sends "Connection: close" on every response. This
+    # run_wsgi keeps HTTP/1.1 connections open instead: the request body is
+    # bounded so leftovers can be drained, and every response is framed by
+    # Content-Length or chunked encoding (for HTTP/1.0 clients, by closing).
+    protocol_version = "HTTP/1.1"
+    timeout = 5  # seconds an idle keep-alive connection may hold a thread
+    max_drain = 1 << 20
+    disable_nagle_algorithm = True  # headers and body go out as separate writes
+
+    def run_wsgi(self):
+        if self.headers.get("Expect", "").lower().strip(" \t") == "100-continue":
+            self.wfile.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+        self.environ = environ = self.make_environ()
+        if "wsgi.input_terminated" not in environ:
+            environ["wsgi.input"] = LimitedStream(self.rfile, int(environ.get("CONTENT_LENGTH") or 0))
+        pending = []
+        sent = []
+
+        def start_response(status, headers, exc_info=None):
+            if exc_info and sent:
+                raise exc_info[1].with_traceback(exc_info[2])
+            pending[:] = [status, headers]
+            return write
+
+        def write(data):
+            if not sent:
+                status, headers = pending
+                code, _, msg = status.partition(" ")
+                code = int(code)
+                self.send_response(code, msg)
+                keys = set()
+                for key, value in headers:
+                    self.send_header(key, value)
+                    keys.add(key.lower())
+                chunked = not ("content-length" in keys or self.command == "HEAD"
+                               or 100 <= code < 200 or code in (204, 304))
+                if chunked and self.request_version == "HTTP/1.0":
+                    # HTTP/1.0 has no chunked coding: the body ends when the connection closes.
+                    chunked, self.close_connection = False, True
+                if chunked:
+                    self.send_header("Transfer-Encoding", "chunked")
+                if getattr(self.server, "backlog", 0):
+                    # Connections are waiting for a thread; don't hold this one idle.
+                    self.close_connection = True
+                if self.close_connection:
+                    self.send_header("Connection", "close")
+                self.end_headers()
+                sent.append(chunked)
+            if data:
+                self.wfile.write(b"%x\r\n%b\r\n" % (len(data), data) if sent[0] else data)
+
+        try:
+            body = self.server.app(environ, start_response)
+            try:
+                for data in body:
+                    write(data)
+                if not sent:
+                    write(b"")
+                if sent[0]:
+                    self.wfile.write(b"0\r\n\r\n")
+            finally:
+                if hasattr(body, "close"):
+                    body.close()
+            drained = 0
+            while not self.close_connection and (chunk := environ["wsgi.input"].read(65536)):
+                drained += len(chunk)
+                if drained > self.max_drain:
+                    self.close_connection = True
+        except (ConnectionError, TimeoutError) as e:
+            self.close_connection = True
+            self.connection_dropped(e, environ)
+        except Exception:
+            self.close_connection = True
+            self.log_error("Error on request:\n%s", traceback.format_exc())
+            if not sent:
+                pending.clear()
+                for data in InternalServerError()(environ, start_response):
+                    write(data)
+
+class _PooledWSGIServer(BaseWSGIServer):
+    # One listening socket shared by every forked worker; each worker hands
+    # accepted connections to a fixed-size thread pool.
+    multithread = True
+    multiprocess = True
+
+    OVERLOADED = (b"HTTP/1.1 503 Service Unavailable\r\nRetry-After: " + OVERLOADED_RETRY_AFTER.encode() +
+                  b"\r\nContent-Length: 0\r\nConnection: close\r\n\r\n")
+
+    def __init__(self, host, port, app, threads, fd, backlog=None, backlog_wait=0.05):
+        self.pool = concurrent.futures.ThreadPoolExecutor(threads, thread_name_prefix="http")
+        # Connections accepted but not yet on a thread. Past max_backlog, or
+        # once one has waited backlog_wait seconds, they get a canned 503
+        # instead of queueing behind everyone else.
+        self.backlog, self.max_backlog, self.backlog_wait = 0, backlog or 4 * threads, backlog_wait
+        self.backlog_lock = threading.Lock()
+        super().__init__(host, port, app, handler=_KeepAliveHandler, fd=fd)
+
+    def process_request(self, request, client_address):
+        with self.backlog_lock:
+            shed = self.backlog >= self.max_backlog
+            if not shed:
+                self.backlog += 1
+        if shed:
+            ADMISSION_REJECTED.inc("server", "backlog")
+            with contextlib.suppress(OSError):
+                request.sendall(self.OVERLOADED)
+            self.shutdown_request(request)
+            return
+        self.pool.submit(self._process, request, client_address, time.perf_counter())
+
+    def _process(self, request, client_address, accepted):
+        with self.backlog_lock:
+            self.backlog -= 1
+        waited = time.perf_counter() - accepted
+        if waited > self.backlog_wait:
+            ADMISSION_REJECTED.inc("server", "timeout")
+            with contextlib.suppress(OSError):
+                request.sendall(self.OVERLOADED)
+            self.shutdown_request(request)
+            return
+        ADMISSION_WAIT.observe(("server",), waited)
+        try:
+            self.finish_request(request, client_address)
+        except Exception:
+            self.handle_error(request, client_address)
+        finally:
+            self.shutdown_request(request)
+
+    def drain(self):
+        # Stop accepting, then wait for in-flight requests to finish.
+        self.server_close()
+        self.pool.shutdown(wait=True)
+
+def _serve_worker(sock, host, port, threads):
+    server = _PooledWSGIServer(host, port, app, threads, fd=sock.fileno())
+
+    def stop(signum, frame):
+        JOB_QUEUE.stop()
+        threading.Thread(target=server.shutdown, daemon=True).start()
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    try:
+        server.serve_forever()
+    finally:
+        JOB_QUEUE.stop()
+        server.drain()
+        JOB_QUEUE.close()
+        HISTORY.close()  # workers leave via os._exit, which skips atexit
+
+def serve(host="0.0.0.0", port=8080, workers=None, threads=8):
+    """Pre-fork production server. The module (compiled template, prebuilt GET
+    page, shared metrics) is already imported here, so workers inherit
+    it copy-on-write. SIGTERM is forwarded to workers, which stop accepting
+    and drain in-flight requests before exiting."""
+    workers = pool_size(workers)
+    sock = socket.create_server((host, port), family=select_address_family(host, port),
+                                backlog=2048, reuse_port=False)
+    sock.set_inheritable(True)
+    gc.freeze()  # keep preloaded objects out of GC passes that would dirty shared pages
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve_worker(sock, host, port, threads)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in children:
+            with contextlib.suppress(ProcessLookupError):
+                os.kill(pid, signal.SIGTERM)
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+    for _ in range(workers):
+        spawn()
+    print(f"serving on http://{host}:{port} with {workers} workers x {threads} threads", file=sys.stderr)
+
+    while children:
+        try:
+            pid, _ = os.wait()
+        except ChildProcessError:
+            break
+        children.discard(pid)
+        if not stopping:
+            print(f"worker {pid} exited; restarting", file=sys.stderr)
+            spawn()
+    sock.close()
+
+INIT_MS = (time.perf_counter() - _T0) * 1000
+WARM_AT = time.time()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="U.S. Navy body fat calculator")
+    sub = parser.add_subparsers(dest="command")
+    p = sub.add_parser("serve", help="run the production server")
+    p.add_argument("--host", default="0.0.0.0")
+    p.add_argument("--port", type=int, default=int(os.environ.get("PORT", 8080)))
+    p.add_argument("--workers", type=int, default=int(os.environ.get("WEB_CONCURRENCY", 0)),
+                   help="worker processes (0 = one per CPU)")
+    p.add_argument("--threads", type=int, default=int(os.environ.get("THREADS", 8)),
+                   help="request threads per worker")
+    p = sub.add_parser("score", help="score a CSV of measurements")
+    p.add_argument("input", help="input CSV path, or - for stdin")
+    p.add_argument("output", help="output CSV path, or - for stdout")
+    p.add_argument("--chunk-size", type=int, default=10000)
+    p.add_argument("--workers", type=int, default=0, help="worker processes (0 = one per CPU)")
+    p.add_argument("--stats", action="store_true", help="print per sex/age band statistics when done")
+    p = sub.add_parser("pack", help="convert a measurement CSV to a columnar dataset file")
+    p.add_argument("input", help="input CSV path, or - for stdin")
+    p.add_argument("output", help="output dataset path")
+    p.add_argument("--float32", action="store_true", help="store measurements as float32 (half the size)")
+    p = sub.add_parser("score-packed", help="score a columnar dataset file into a columnar results file")
+    p.add_argument("input")
+    p.add_argument("output")
+    p.add_argument("--chunk-rows", type=int, default=1 << 20)
+    p.add_argument("--workers", type=int, default=1, help="worker processes (0 = one per CPU)")
+    p = sub.add_parser("chart", help="write body fat lookup charts, one CSV per person")
+    p.add_argument("input", help="CSV with subject, sex, height, neck columns, or - for stdin")
+    p.add_argument("outdir")
+    p.add_argument("--unit", choices=sorted(CHART_STEPS), default="cm")
+    p = sub.add_parser("reference", help="add new history results to the percentile reference index")
+    p.add_argument("--csv", help="add the results of a scored CSV (sex, age, bodyfat columns) instead, or - for stdin")
+    p.add_argument("--rebuild", action="store_true", help="start from an empty index")
+    p.add_argument("--output", default=REFERENCE.path)
+    p = sub.add_parser("startup", help="profile cold start and check it against a budget")
+    p.add_argument("--runs", type=int, default=3)
+    p.add_argument("--budget-ms", type=float, default=float(os.environ.get("STARTUP_BUDGET_MS", 1500)))
+    args = parser.parse_args(argv)
+
+    if args.command == "startup":
+        sys.exit(0 if startup_profile(args.runs, args.budget_ms) else 1)
+    if args.command == "score":
+        with _open_csv(args.input, "r") as src, _open_csv(args.output, "w") as dst:
+            rows, errors = score_csv(src, dst, args.chunk_size, pool_size(args.workers), args.stats)
+        print(f"scored {rows} rows ({errors} with errors)", file=sys.stderr)
+        if args.stats:  # pool workers' partials are merged in the shared metrics rows
+            print(json.dumps(stats_snapshot(), indent=2), file=sys.stderr)
+        return
+    if args.command == "pack":
+        with _open_csv(args.input, "r") as src:
+            rows = pack_csv(src, args.output, args.float32)
+        print(f"packed {rows} rows into {args.output}", file=sys.stderr)
+        return
+    if args.command == "score-packed":
+        rows, errors = score_packed(args.input, args.output, args.chunk_rows, pool_size(args.workers))
+        print(f"scored {rows} rows ({errors} with errors)", file=sys.stderr)
+        return
+    if args.command == "reference":
+        if args.csv:
+            with _open_csv(args.csv, "r") as src:
+                added, total = update_reference(args.output, reference_csv_rows(src), args.rebuild)
+        else:
+            added, total = update_reference(args.output, rebuild=args.rebuild)
+        print(f"added {added} results; {args.output} holds {total}", file=sys.stderr)
+        return
+    if args.command == "chart":
+        with _open_csv(args.input, "r") as src:
+            n = write_charts(src, args.outdir, args.unit)
+        print(f"wrote {n} charts to {args.outdir}", file=sys.stderr)
+        return
+    if args.command == "serve":
+        serve(args.host, args.port, args.workers, args.threads)
+        return
+
+    # No subcommand: Flask development server
     port = int(os.environ.get("PORT", 8080))
     app.run(host="0.0.0.0", port=port)
+
+if __name__ == "__main__":
+    main()
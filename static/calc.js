@@ -0,0 +1,363 @@
+// ------- helpers -------
+const ranges = JSON.parse(document.getElementById('ranges').textContent);
+const calc = JSON.parse(document.getElementById('calc').textContent);  // formula, plan, messages (see _calc_config)
+const cmPerIn = calc.cm_per_in;
+const kgPerLb = calc.kg_per_lb;
+
+const examples = {
+  weight_kg: 70.0,
+  neck_cm: 38.0,
+  waist_cm: 82.0,
+  hip_cm: 95.0
+};
+
+function clamp(v, lo, hi){ return Math.min(hi, Math.max(lo, v)); }
+function setText(id, txt){ const el = document.getElementById(id); if(el) el.textContent = txt; }
+function setPH(id, txt){ const el = document.getElementById(id); if(el) el.setAttribute('placeholder', txt); }
+
+function curVal(id){
+  const el = document.getElementById(id);
+  if(!el || el.value === "") return null;
+  const v = parseFloat(el.value);
+  return Number.isFinite(v) ? v : null;
+}
+
+// numeric guards
+function attachNumericGuards(sel){
+  document.querySelectorAll(sel).forEach(inp => {
+    inp.addEventListener('keydown', function(e){
+      const allowed = ["Backspace","Tab","ArrowLeft","ArrowRight","Delete","Enter",".","Home","End"];
+      if ((e.key >= "0" && e.key <= "9") || allowed.includes(e.key)) {
+        if (e.key === "." && this.value.includes(".")) e.preventDefault();
+        return;
+      }
+      if ((e.ctrlKey || e.metaKey) && ["a","c","v","x","z","y"].includes(e.key.toLowerCase())) return;
+      e.preventDefault();
+    });
+  });
+}
+attachNumericGuards('input[type="number"]');
+
+// ------- placeholders that follow unit toggles (weight, neck, waist, hip) -------
+function kgToLb(kg){ return kg / kgPerLb; }
+function cmToIn(cm){ return cm / cmPerIn; }
+
+function updatePlaceholders(){
+  // Weight example
+  const wUnit = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
+  if(wUnit === 'kg'){
+    setPH('weight_val', `e.g., ${examples.weight_kg.toFixed(1)}`);
+  } else {
+    const lb = kgToLb(examples.weight_kg);
+    setPH('weight_val', `e.g., ${Math.round(lb)}`);
+  }
+  // Neck example
+  const nUnit = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
+  if(nUnit === 'cm'){
+    setPH('neck_val', `e.g., ${examples.neck_cm.toFixed(1)}`);
+  } else {
+    setPH('neck_val', `e.g., ${ (Math.round(cmToIn(examples.neck_cm)*10)/10).toFixed(1) }`);
+  }
+  // Waist example
+  const wU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
+  if(wU === 'cm'){
+    setPH('waist_val', `e.g., ${examples.waist_cm.toFixed(1)}`);
+  } else {
+    setPH('waist_val', `e.g., ${ (Math.round(cmToIn(examples.waist_cm)*10)/10).toFixed(1) }`);
+  }
+  // Hip example
+  const hU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
+  if(hU === 'cm'){
+    setPH('hip_val', `e.g., ${examples.hip_cm.toFixed(1)}`);
+  } else {
+    setPH('hip_val', `e.g., ${ (Math.round(cmToIn(examples.hip_cm)*10)/10).toFixed(1) }`);
+  }
+}
+
+// ------- unit UI/hints -------
+function toggleHeight(){
+  const unit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
+  const cmBox = document.getElementById('height_cm_box');
+  const ftinBox = document.getElementById('height_ftin_box');
+  if(unit === 'cm'){ cmBox.style.display = ''; ftinBox.style.display = 'none'; }
+  else { cmBox.style.display = 'none'; ftinBox.style.display = ''; }
+  updateHints();
+  markAllValidity();
+}
+
+function onUnitToggle(){
+  updateHints();
+  updatePlaceholders();
+  markAllValidity();
+}
+
+function updateHints(){
+  // Height hint (ft/in range)
+  const ftRange = cmToFeetInRange(ranges.height_cm.min, ranges.height_cm.max);
+  setText('height_range_hint', `Allowed: ${ftRange.min.ft}′${ftRange.min.in.toFixed(1)}″–${ftRange.max.ft}′${ftRange.max.in.toFixed(1)}″`);
+  // Weight hint
+  const unitW = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
+  if(unitW === 'kg'){
+    setText('weight_range_hint', `Allowed: ${ranges.weight_kg.min}–${ranges.weight_kg.max} kg`);
+  } else {
+    const lo = ranges.weight_kg.min / kgPerLb;
+    const hi = ranges.weight_kg.max / kgPerLb;
+    setText('weight_range_hint', `Allowed: ${lo.toFixed(1)}–${hi.toFixed(1)} lbs`);
+  }
+  // Neck/Waist/Hip hints
+  const nkU = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
+  const wsU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
+  const hpU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
+  setText('neck_range_hint',  rangeHint('neck_cm',  nkU));
+  setText('waist_range_hint', rangeHint('waist_cm', wsU));
+  setText('hip_range_hint',   rangeHint('hip_cm',   hpU));
+}
+
+function rangeHint(metricKey, unit){
+  const {min, max} = ranges[metricKey];
+  if(unit === 'cm') return `Allowed: ${min}–${max} cm`;
+  const lo = min / cmPerIn;
+  const hi = max / cmPerIn;
+  return `Allowed: ${lo.toFixed(1)}–${hi.toFixed(1)} in`;
+}
+
+function cmToFeetIn(cm){
+  const totalIn = cm / cmPerIn;
+  const ft = Math.floor(totalIn / 12);
+  const inch = totalIn - ft*12;
+  return {ft, inch};
+}
+function cmToFeetInRange(minCm, maxCm){
+  const a = cmToFeetIn(minCm);
+  const b = cmToFeetIn(maxCm);
+  return {min: {ft:a.ft, in:a.inch}, max:{ft:b.ft, in:b.inch}};
+}
+
+// ------- validation that respects units -------
+const submitBtn = document.getElementById('submitBtn');
+
+function isInRangeMetric(v, key){
+  const r = ranges[key];
+  return v !== null && !Number.isNaN(v) && v >= r.min && v <= r.max;
+}
+
+function markBad(el, bad){
+  if(!el) return;
+  if(bad) el.classList.add('bad'); else el.classList.remove('bad');
+}
+
+function getEffectiveValuesMetric(){
+  // Height
+  const hUnit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
+  let height_cm = null;
+  if(hUnit === 'cm'){
+    const v = curVal('height_cm');
+    height_cm = v;
+  } else {
+    const ft = curVal('height_ft') || 0;
+    const inch = curVal('height_in') || 0;
+    const totalIn = ft*12 + inch;
+    height_cm = totalIn > 0 ? totalIn * cmPerIn : null;
+  }
+  // Weight
+  const wUnit = document.querySelector('input[name="weight_unit"]:checked')?.value || 'kg';
+  let weight_kg = null;
+  const w = curVal('weight_val');
+  if(w !== null){
+    weight_kg = (wUnit === 'kg') ? w : w * kgPerLb;
+  }
+  // Neck
+  const nUnit = document.querySelector('input[name="neck_unit"]:checked')?.value || 'cm';
+  let neck_cm = null;
+  const n = curVal('neck_val');
+  if(n !== null) neck_cm = (nUnit === 'cm') ? n : n * cmPerIn;
+  // Waist
+  const wU = document.querySelector('input[name="waist_unit"]:checked')?.value || 'cm';
+  let waist_cm = null;
+  const wv = curVal('waist_val');
+  if(wv !== null) waist_cm = (wU === 'cm') ? wv : wv * cmPerIn;
+  // Hip
+  const hU = document.querySelector('input[name="hip_unit"]:checked')?.value || 'cm';
+  let hip_cm = null;
+  const hv = curVal('hip_val');
+  if(hv !== null) hip_cm = (hU === 'cm') ? hv : hv * cmPerIn;
+
+  // Age
+  const age = curVal('age');
+
+  return {age, height_cm, weight_kg, neck_cm, waist_cm, hip_cm};
+}
+
+function markAllValidity(){
+  const eff = getEffectiveValuesMetric();
+  // Height
+  const hUnit = document.querySelector('input[name="height_unit"]:checked')?.value || 'cm';
+  if(hUnit === 'cm'){
+    markBad(document.getElementById('height_cm'), !isInRangeMetric(eff.height_cm, 'height_cm'));
+  } else {
+    const bad = !isInRangeMetric(eff.height_cm, 'height_cm');
+    markBad(document.getElementById('height_ft'), bad);
+    markBad(document.getElementById('height_in'), bad);
+  }
+  // Weight (optional; only mark if filled)
+  const wBad = (eff.weight_kg !== null) && !isInRangeMetric(eff.weight_kg, 'weight_kg');
+  markBad(document.getElementById('weight_val'), wBad);
+  // Neck/Waist/Hip
+  markBad(document.getElementById('neck_val'),  !isInRangeMetric(eff.neck_cm, 'neck_cm'));
+  markBad(document.getElementById('waist_val'), !isInRangeMetric(eff.waist_cm, 'waist_cm'));
+  const hipEl = document.getElementById('hip_val');
+  if(hipEl.value === "") { markBad(hipEl, false); }
+  else { markBad(hipEl, !isInRangeMetric(eff.hip_cm, 'hip_cm')); }
+  // Age
+  const ageEl = document.getElementById('age');
+  if(ageEl.value === "") markBad(ageEl, false);
+  else markBad(ageEl, !isInRangeMetric(eff.age, 'age'));
+
+  // Disable submit if any .bad present
+  const anyBad = !!document.querySelector('input.bad');
+  submitBtn.disabled = anyBad;
+}
+
+// ------- calculation (same arithmetic as Schema.check + evaluate on the server) -------
+function checkErrors(eff, female){
+  // Schema.check: missing fields first, then out-of-range ones, in plan order.
+  const missing = [], outOfRange = [];
+  for(const [key, required, missingCode, lo, hi, rangeCode, optionalCode] of calc.plan){
+    const v = eff[key];
+    const needed = required === true || (required === 'female' && female);
+    if(v === null){ if(needed) missing.push(missingCode); }
+    else if(!(lo <= v && v <= hi)) outOfRange.push(needed ? rangeCode : optionalCode);
+  }
+  return missing.concat(outOfRange);
+}
+
+function round2(x){
+  // Python's round(x, 2): the hundredth nearest x's exact binary value (what
+  // toFixed finds), but exact ties (x = k/8) go to the even hundredth where
+  // toFixed goes away from zero.
+  const ax = Math.abs(x);
+  let n = parseInt(ax.toFixed(2).replace('.', ''), 10);
+  if(Number.isInteger(ax * 8) && !Number.isInteger(ax * 4) && n % 2) n -= 1;
+  return Math.sign(x) * (n / 100);  // keeps the sign of zero, as Python does
+}
+
+function navyBodyfat(eff, female){
+  // navy_bodyfat_percent on evaluate()'s inputs (metric / cmPerIn), rounded and clamped.
+  const [a, b, c] = calc.coeffs[female ? 'female' : 'male'];
+  const h = eff.height_cm / cmPerIn, n = eff.neck_cm / cmPerIn, w = eff.waist_cm / cmPerIn;
+  const x = female ? w + eff.hip_cm / cmPerIn - n : w - n;
+  if(x <= 0 || h <= 0) return null;
+  const bf = round2(a * Math.log10(x) - b * Math.log10(h) + c);
+  return Math.max(calc.clamp[0], Math.min(calc.clamp[1], bf));
+}
+
+function formatPct(v){
+  return (Object.is(v, -0) ? '-' : '') + v.toFixed(2);  // f"{v:.2f}" keeps the sign of zero
+}
+
+function showResult(node){
+  document.querySelectorAll('.result').forEach(n => n.remove());
+  document.getElementById('calcForm').before(node);
+}
+
+function el(tag, cls, ...children){
+  const node = document.createElement(tag);
+  if(cls) node.className = cls;
+  node.append(...children);
+  return node;
+}
+
+function renderResult(value, eff){
+  const text = el('span', null, formatPct(value));
+  const box = el('div', 'result ok', el('div', null, el('strong', null, 'Estimated Body Fat:'), ' ', text, '%'));
+  if(eff.weight_kg !== null && eff.age === null){
+    box.append(el('div', 'hint', 'Note: weight is not used by the Navy formula; add your age for BMI-based estimates.'));
+  }
+  showResult(box);
+  return {box, text};
+}
+
+let recordSeq = 0;
+
+function record(form, shown){
+  // Beacon after every result: the server scores and counts the submission
+  // like a form POST (keeping history only under a subject), and its answer
+  // (authoritative, plus the other estimates and the percentile) completes
+  // ours if still shown.
+  const seq = ++recordSeq;
+  fetch(calc.record_url, {
+    method: 'POST', keepalive: true, headers: {'Content-Type': 'application/json'},
+    body: JSON.stringify(Object.fromEntries(new FormData(form))),
+  }).then(r => r.ok ? r.json() : null).then(data => {
+    if(!data || seq !== recordSeq) return;
+    shown.text.textContent = formatPct(data.bodyfat);
+    const others = Object.entries(data.estimates || {}).filter(([name]) => name !== calc.primary);
+    if(others.length){
+      shown.box.querySelectorAll('.hint').forEach(n => n.remove());
+      const list = others.map(([name, v]) => `${calc.estimators[name] || name} ${formatPct(v)}%`).join(', ');
+      shown.box.append(el('div', 'hint', `Other estimates: ${list}`));
+    }
+    if(data.percentile) shown.box.append(el('div', 'hint', `That is the ${data.percentile.text}.`));
+  }).catch(() => {});
+}
+
+function onSubmit(e){
+  // Computed here; the form POST only runs if this throws (or without JS).
+  const form = e.target;
+  const female = form.querySelector('input[name="sex"]:checked')?.value === 'female';
+  const eff = getEffectiveValuesMetric();
+  let errors = checkErrors(eff, female);
+  const value = errors.length ? null : navyBodyfat(eff, female);
+  if(!errors.length && value === null) errors = [female ? 'formula_female' : 'formula_male'];
+  e.preventDefault();
+  if(errors.length){
+    ++recordSeq;
+    showResult(el('div', 'result err', el('strong', null, 'Error:'), ' ', errors.map(c => calc.errors[c]).join(' ')));
+    return;
+  }
+  record(form, renderResult(value, eff));
+}
+
+function clampOnBlur(e){
+  const id = e.target.id;
+  if(id === 'height_ft' || id === 'height_in'){
+    const eff = getEffectiveValuesMetric();
+    if(eff.height_cm === null) return;
+    let cm = clamp(eff.height_cm, ranges.height_cm.min, ranges.height_cm.max);
+    const totalIn = cm / cmPerIn;
+    const ft = Math.floor(totalIn / 12);
+    const inch = (totalIn - ft*12);
+    document.getElementById('height_ft').value = ft;
+    document.getElementById('height_in').value = Math.round(inch*10)/10;
+  }
+  markAllValidity();
+}
+
+function wire(){
+  toggleHeight();
+  updateHints();
+  updatePlaceholders();
+
+  document.querySelectorAll('input[type="number"]').forEach(inp => {
+    inp.addEventListener('input', markAllValidity);
+    inp.addEventListener('blur', clampOnBlur);
+  });
+  ['height_unit','weight_unit','neck_unit','waist_unit','hip_unit'].forEach(name => {
+    document.querySelectorAll(`input[name="${name}"]`).forEach(r => r.addEventListener('change', onUnitToggle));
+  });
+
+  document.getElementById('calcForm').addEventListener('submit', onSubmit);
+
+  document.getElementById('resetBtn').addEventListener('click', function(){
+    const form = document.getElementById('calcForm');
+    form.reset();
+    document.querySelectorAll('.result').forEach(n => n.remove());
+    document.querySelectorAll('input.bad').forEach(el => el.classList.remove('bad'));
+    submitBtn.disabled = false;
+    toggleHeight(); updateHints(); updatePlaceholders();
+  });
+
+  markAllValidity();
+}
+
+wire();
@@ -0,0 +1,154 @@
+# Every path that scores a form must agree exactly with evaluate():
+# the batch engine, the columnar unit normalization and the page script.
+import csv, io, json, os, random, shutil, subprocess
+
+import pytest
+
+os.environ["BODYFAT_HISTORY_DB"] = ""
+import main
+
+np = pytest.importorskip("numpy")
+main._require_numpy()
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+CALC_JS = os.path.join(HERE, os.pardir, "static", "calc.js")
+
+def _num(rng, lo, hi):
+    return rng.choice(["", f"{rng.uniform(lo, hi):.1f}", f"{rng.uniform(lo, hi):.2f}", f"{rng.uniform(lo, hi):.3f}",
+                       str(rng.randint(int(lo), int(hi)))])
+
+def _form(rng):
+    # Mostly near the valid ranges, in either unit, so every error code and
+    # every estimator is exercised.
+    return dict(sex=rng.choice(["male", "female"]), age=_num(rng, 10, 90),
+                height_unit=rng.choice(["cm", "ftin"]), height_cm=_num(rng, 120, 240),
+                height_ft=rng.choice(["", "4", "5", "6", "7"]), height_in=_num(rng, 0, 12),
+                weight_unit=rng.choice(["kg", "lb"]), weight_val=_num(rng, 30, 210),
+                neck_unit=rng.choice(["cm", "in"]), neck_val=rng.choice([_num(rng, 24, 61), _num(rng, 9, 25)]),
+                waist_unit=rng.choice(["cm", "in"]), waist_val=rng.choice([_num(rng, 45, 205), _num(rng, 18, 80)]),
+                hip_unit=rng.choice(["cm", "in"]), hip_val=rng.choice([_num(rng, 55, 205), _num(rng, 22, 80)]))
+
+def _messy(rng):
+    # Anything a CSV cell can hold: blanks, junk, signs, non-finite values,
+    # unknown units and missing columns.
+    def cell(lo, hi):
+        return rng.choice(["", f"{rng.uniform(lo, hi):.1f}", f"{rng.uniform(lo, hi):.3f}", "0", "-0", "-3",
+                           "nan", "inf", "x", " 12 ", "1e2", None])
+    row = dict(sex=rng.choice(["male", "female", "", "FEMALE", None]), age=cell(10, 90),
+               height_unit=rng.choice(["cm", "ftin", "", "in", None, "CM"]), height_cm=cell(120, 240),
+               height_ft=cell(0, 7), height_in=cell(0, 12), weight_unit=rng.choice(["kg", "lb", "", "g"]),
+               weight_val=cell(30, 210), neck_unit=rng.choice(["cm", "in", "", "mm"]), neck_val=cell(10, 60),
+               waist_unit=rng.choice(["cm", "in"]), waist_val=cell(25, 150), hip_unit=rng.choice(["cm", "in", ""]),
+               hip_val=cell(25, 150))
+    return {k: v for k, v in row.items() if rng.random() >= 0.05}
+
+def test_batch_matches_scalar():
+    rng = random.Random(3)
+    ms = [main.SCHEMA.parse(_form(rng)) for _ in range(20000)]
+    _, mask, estimates = main.evaluate_batch(main.MeasurementColumns.from_measurements(ms))
+    for i, m in enumerate(ms):
+        result, errors, _, scalar = main.evaluate(m)
+        assert main.error_codes(mask[i]) == errors, i
+        for name in main.ESTIMATORS:
+            batch = estimates[name][i]
+            if name in scalar:
+                assert scalar[name] == batch, (i, name)
+            else:
+                assert np.isnan(batch), (i, name)
+
+def _ties():
+    # Every x.xx5 from -10 to 70 and its neighbouring doubles: where
+    # rint(x * 100) and round(x, 2) can disagree.
+    grid = np.arange(-2000, 14001) / 200.0
+    return np.concatenate([grid, np.nextafter(grid, -np.inf), np.nextafter(grid, np.inf)])
+
+def test_batch_rounding_matches_round():
+    values = _ties()
+    expect = [round(v, 2) for v in values.tolist()]
+    assert main._round2_exact(values, lambda i: round(float(values[i]), 2)).tolist() == expect
+
+def test_normalize_columns_matches_parse():
+    rng = random.Random(1)
+    rows = [_messy(rng) for _ in range(20000)]
+    parsed = main.MeasurementColumns.from_measurements(main.SCHEMA.parse(r) for r in rows)
+    normalized = main.SCHEMA.normalize_columns(main.SCHEMA.entered_columns(rows))
+    for key in main.MeasurementColumns.__slots__:
+        a, b = getattr(parsed, key), getattr(normalized, key)
+        if a.dtype.kind == "f":
+            assert np.array_equal(a, b, equal_nan=True), key
+            assert np.array_equal(np.signbit(a[~np.isnan(a)]), np.signbit(b[~np.isnan(b)])), key
+        else:
+            assert np.array_equal(a, b), key
+
+def test_score_csv_matches_rows():
+    # score (serial and pooled) and jobs score chunks in batch; the text must
+    # be what scoring row by row gives.
+    rng = random.Random(9)
+    src = io.StringIO()
+    writer = csv.DictWriter(src, fieldnames=main.FORM_FIELDS)
+    writer.writeheader()
+    writer.writerows([_messy(rng) for _ in range(3000)] + [_form(rng) for _ in range(3000)])
+    expect = io.StringIO()
+    reader = csv.DictReader(io.StringIO(src.getvalue()))
+    writer = csv.DictWriter(expect, fieldnames=main._output_fields(reader.fieldnames), extrasaction="ignore")
+    writer.writeheader()
+    for chunk in main._score_rows(main._read_chunks(reader, 1000)):
+        writer.writerows(chunk)
+    for workers in (1, 2):
+        out = io.StringIO()
+        main.score_csv(io.StringIO(src.getvalue()), out, 1000, workers)
+        assert out.getvalue() == expect.getvalue(), workers
+
+# Runs calc.js's own functions (cut out of the file by name) on the cases
+# and prints every disagreement with the server's answer.
+_NODE_HARNESS = r"""
+const fs = require('fs');
+const data = JSON.parse(fs.readFileSync(process.argv[2]));
+const src = fs.readFileSync(process.argv[3], 'utf8');
+function extract(name){
+  const i = src.indexOf(`function ${name}(`);
+  let d = 0, j = src.indexOf('{', i);
+  for(;; j++){ if(src[j] === '{') d++; else if(src[j] === '}' && !--d) break; }
+  return src.slice(i, j + 1);
+}
+let cur = {};
+const document = {
+  getElementById: id => (id in cur ? {value: cur[id]} : null),
+  querySelector: sel => { const m = /name="(\w+)"/.exec(sel); return m && cur[m[1]] ? {value: cur[m[1]]} : null; },
+};
+const calc = data.calc;
+const code = ['curVal', 'getEffectiveValuesMetric', 'checkErrors', 'round2', 'navyBodyfat', 'formatPct'].map(extract).join('\n');
+const fns = new Function('document', 'calc', 'cmPerIn', 'kgPerLb',
+  code + '\nreturn {getEffectiveValuesMetric, checkErrors, round2, navyBodyfat, formatPct};')(document, calc, calc.cm_per_in, calc.kg_per_lb);
+const bad = [];
+for(const [form, expect, expectErrors] of data.cases){
+  cur = form;
+  const female = form.sex === 'female';
+  const eff = fns.getEffectiveValuesMetric();
+  let errors = fns.checkErrors(eff, female);
+  const value = errors.length ? null : fns.navyBodyfat(eff, female);
+  if(!errors.length && value === null) errors = [female ? 'formula_female' : 'formula_male'];
+  const got = errors.length ? null : fns.formatPct(value);
+  if(got !== expect || JSON.stringify(errors) !== JSON.stringify(expectErrors)) bad.push([form, got, expect, errors]);
+}
+for(const [x, expect] of data.ties){
+  if(!Object.is(fns.round2(x), expect)) bad.push(['round2', x, fns.round2(x), expect]);
+}
+console.log(JSON.stringify(bad.slice(0, 5)));
+"""
+
+@pytest.mark.skipif(shutil.which("node") is None, reason="needs node")
+def test_page_script_matches_server(tmp_path):
+    rng = random.Random(7)
+    cases = []
+    for _ in range(20000):
+        form = _form(rng)
+        result, errors, _, _ = main.evaluate(main.SCHEMA.parse(form))
+        cases.append([form, None if errors else f"{result:.2f}", errors])
+    assert sum(1 for c in cases if c[1]) > 1000  # enough valid forms to compare results, not just errors
+    (tmp_path / "cases.json").write_text(json.dumps({"calc": main._calc_config(), "cases": cases,
+                                                        "ties": [[v, round(v, 2)] for v in _ties().tolist()]}))
+    (tmp_path / "harness.js").write_text(_NODE_HARNESS)
+    out = subprocess.run(["node", str(tmp_path / "harness.js"), str(tmp_path / "cases.json"), CALC_JS],
+                         capture_output=True, text=True, check=True).stdout
+    assert json.loads(out) == []
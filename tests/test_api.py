@@ -0,0 +1,97 @@
+# The JSON API answers malformed input with a JSON error, never a 500.
+import os, time
+
+import pytest
+
+os.environ["BODYFAT_HISTORY_DB"] = ""
+import main
+
+VALID = dict(sex="male", age="30", height_unit="cm", height_cm="180", neck_unit="cm", neck_val="38",
+             waist_unit="cm", waist_val="85")
+JUNK = ([], {}, [1], {"a": 1}, 1, 1.5, True, None)
+
+@pytest.fixture
+def client():
+    return main.app.test_client()
+
+@pytest.mark.parametrize("field", main.FORM_FIELDS)
+def test_malformed_field_values(client, field):
+    for value in JUNK:
+        rec = dict(VALID, **{field: value})
+        r = client.post("/api/v1/bodyfat", json=[rec])
+        assert r.status_code == 200, (field, value)
+        assert set(r.get_json()[0]) & {"bodyfat", "error"}, (field, value)
+        r = client.post("/api/v1/record", json=rec)
+        assert r.status_code in (200, 422), (field, value)
+        assert r.is_json, (field, value)
+    assert all(gate.active == 0 for gate in main.ADMISSION.values())
+
+def test_unknown_unit_takes_the_default(client):
+    # Like any other unknown unit: the field's default (cm).
+    expect = client.post("/api/v1/bodyfat", json=[VALID]).get_json()
+    for unit in ([], {"cm": 1}):
+        got = client.post("/api/v1/bodyfat", json=[dict(VALID, height_unit=unit)]).get_json()
+        assert got == expect
+
+@pytest.mark.parametrize("body", [[1, "x", None, []], "x", 5, {"sex": "male"}])
+def test_malformed_batches(client, body):
+    r = client.post("/api/v1/bodyfat", json=body)
+    assert r.is_json
+    if isinstance(body, list):
+        assert r.status_code == 200
+        assert all("error" in rec for rec in r.get_json())
+    else:
+        assert r.status_code == 400
+
+def test_record_beacon_with_and_without_subject(client, monkeypatch):
+    # The page sends every calculation: all are scored and counted like a form
+    # POST, and only those under a subject are kept in history.
+    kept = []
+    monkeypatch.setattr(main.HISTORY, "record", lambda m, result: kept.append(m.subject))
+    def count():
+        return sum(g["count"] for g in main.stats_snapshot()["groups"] if g["sex"] == "male" and g["age_band"] == "30-39")
+    before = count()
+    for subject in ("", "alex"):
+        rec = dict(VALID, subject=subject, weight_unit="kg", weight_val="80")
+        got = client.post("/api/v1/record", json=rec).get_json()
+        assert got == client.post("/api/v1/bodyfat", json=[rec]).get_json()[0]
+        assert set(got["estimates"]) == {"navy", "deurenberg", "cun_bae"}
+    assert kept == ["alex"] and count() == before + 2
+    page = client.post("/", data=dict(VALID, weight_unit="kg", weight_val="80")).get_data(as_text=True)
+    assert "Other estimates" in page and kept == ["alex"] and count() == before + 3
+
+@pytest.mark.parametrize("body", [[VALID], "x", 5, None])
+def test_malformed_record_beacon(client, body):
+    r = client.post("/api/v1/record", json=body)
+    assert r.status_code == 400 and r.is_json
+
+def test_batch_limits(client, monkeypatch):
+    monkeypatch.setattr(main, "API_MAX_RECORDS", 3)
+    assert client.post("/api/v1/bodyfat", json=[VALID] * 3).status_code == 200
+    assert client.post("/api/v1/bodyfat", json=[VALID] * 4).status_code == 413
+
+@pytest.mark.parametrize("bodyfat", ["1e308", "-1e308", "75.01", "-5.01", "x", ""])
+def test_inverse_rejects_bodyfat_out_of_range(client, bodyfat):
+    r = client.get(f"/api/v1/inverse?sex=male&bodyfat={bodyfat}&height=180&neck=38")
+    assert r.status_code == 400 and r.is_json
+
+def test_inverse_round_trips(client):
+    waist = client.get("/api/v1/inverse?sex=male&bodyfat=16.15&height=180&neck=38").get_json()["waist"]
+    got = client.post("/api/v1/bodyfat", json=[dict(VALID, waist_val=str(waist))]).get_json()[0]["bodyfat"]
+    assert got == 16.15
+
+def test_job_submit_returns_the_queued_snapshot(client, monkeypatch, tmp_path):
+    monkeypatch.setattr(main, "JOB_QUEUE", main.JobQueue(str(tmp_path)))
+    csv_body = "sex,height_unit,height_cm,neck_unit,neck_val,waist_unit,waist_val\n" + "male,cm,180,cm,38,cm,85\n" * 20000
+    r = client.post("/api/v1/jobs", data=csv_body, content_type="text/csv")
+    try:
+        assert r.status_code == 202
+        view = r.get_json()
+        assert view["state"] == "queued" and view["rows_done"] == 0 and "started" not in view
+        deadline = time.monotonic() + 60
+        while main.JOB_QUEUE.status(view["id"])["state"] in ("queued", "running") and time.monotonic() < deadline:
+            time.sleep(0.05)
+        status = main.JOB_QUEUE.status(view["id"])
+        assert status["state"] == "done" and status["rows_done"] == 20000
+    finally:
+        main.JOB_QUEUE.close()
@@ -0,0 +1,116 @@
+# Round trips through the on-disk binary formats: columnar datasets and the
+# percentile reference index.
+import io, os, random
+
+import pytest
+
+os.environ["BODYFAT_HISTORY_DB"] = ""
+import main
+from main import Sex
+
+np = pytest.importorskip("numpy")
+main._require_numpy()
+
+def test_column_file_round_trip(tmp_path):
+    rng = np.random.default_rng(0)
+    n = 1003  # not a multiple of 8
+    data = {"a": rng.normal(size=n), "b": rng.normal(size=n).astype("<f4"), "e": rng.integers(0, 1 << 16, n, "<u2")}
+    data["a"][::7] = np.nan
+    bits = rng.integers(0, 2, n).astype(np.uint8)
+    path = tmp_path / "d.bfc"
+    with main.ColumnWriter(str(path), [("a", "<f8"), ("b", "<f4"), ("e", "<u2"), ("s", "bits")], n) as w:
+        for key, values in data.items():
+            w[key][:] = values
+        w["s"][:] = np.packbits(bits, bitorder="little")
+    with main.ColumnFile(str(path)) as f:
+        assert f.rows == n and list(f.columns) == ["a", "b", "e", "s"]
+        assert all(offset % main.COLUMN_ALIGN == 0 for _, offset, _ in f.columns.values())
+        for key, values in data.items():
+            assert f[key].dtype == values.dtype
+            assert np.array_equal(f[key], values, equal_nan=key != "e")
+        assert np.array_equal(f.bits("s"), bits)
+        assert np.array_equal(f.bits("s", 504, 1003), bits[504:])
+
+def test_column_writer_leaves_nothing_on_error(tmp_path):
+    path = tmp_path / "d.bfc"
+    with pytest.raises(RuntimeError):
+        with main.ColumnWriter(str(path), [("a", "<f8")], 10):
+            raise RuntimeError
+    assert os.listdir(tmp_path) == []
+
+def test_column_file_rejects_other_files(tmp_path):
+    path = tmp_path / "x"
+    path.write_bytes(b"\0" * 64)
+    with pytest.raises(ValueError):
+        main.ColumnFile(str(path))
+
+def _csv(rows):
+    out = io.StringIO()
+    out.write("sex,age,height_unit,height_cm,height_ft,height_in,weight_unit,weight_val,neck_unit,neck_val,"
+              "waist_unit,waist_val,hip_unit,hip_val\n")
+    for r in rows:
+        out.write(",".join(r) + "\n")
+    out.seek(0)
+    return out
+
+def test_pack_csv_any_chunk_size(tmp_path):
+    rng = random.Random(2)
+    rows = [(rng.choice(["male", "female"]), str(rng.randint(13, 80)), rng.choice(["cm", "ftin"]),
+             str(rng.randint(150, 200)), "5", str(rng.randint(0, 11)), rng.choice(["kg", "lb"]), str(rng.randint(50, 150)),
+             rng.choice(["cm", "in"]), str(rng.randint(14, 40)), "cm", str(rng.randint(60, 120)), "cm", "")
+            for _ in range(203)]
+    expect = None
+    for chunk_rows in (1, 7, 13, 64, 65536):
+        path = tmp_path / f"p{chunk_rows}.bfc"
+        assert main.pack_csv(_csv(rows), str(path), chunk_rows=chunk_rows) == len(rows)
+        with main.ColumnFile(str(path)) as f:
+            assert np.array_equal(f.bits("sex"), [r[0] == "female" for r in rows]), chunk_rows
+        data = path.read_bytes()
+        assert expect is None or data == expect, chunk_rows
+        expect = data
+    parsed = [main.SCHEMA.parse(dict(zip(_csv([]).readline().strip().split(","), r))) for r in rows]
+    with main.ColumnFile(str(tmp_path / "p7.bfc")) as f:
+        cols = f.measurements()
+        for key in main.PACKED_FIELDS:
+            expect = np.array([np.nan if getattr(m, key) is None else getattr(m, key) for m in parsed])
+            assert np.array_equal(getattr(cols, key), expect, equal_nan=True), key
+
+def _percentile(population, value):
+    below = sum(v < value for v in population)
+    return 100.0 * (below + sum(v == value for v in population) / 2) / len(population)
+
+def test_reference_index_lookup(tmp_path):
+    rng = random.Random(5)
+    # Few distinct values, so ties are common.
+    rows = [(rng.choice(["male", "female"]), rng.choice([None, 15, 25, 35, 45, 75]), rng.choice([10.5, 12.0, 15.25, 20.0, 31.5]))
+            for _ in range(2000)]
+    path = str(tmp_path / "r.idx")
+    assert main.update_reference(path, rows) == (2000, 2000)
+    ref = main.ReferenceIndex(path, min_count=1)
+    for sex, name in ((Sex.MALE, "male"), (Sex.FEMALE, "female")):
+        for age in (None, 15, 25, 35, 45, 75, 55):
+            band = main.age_band(age)
+            pop = [bf for s, a, bf in rows if s == name and (band == "unknown" or main.age_band(a) == band)]
+            for value in (5.0, 10.5, 12.0, 13.0, 31.5, 40.0):
+                got = ref.lookup(sex, age, value)
+                if not pop:
+                    assert got is None
+                    continue
+                pct, got_band, n = got
+                assert got_band == ("all" if band == "unknown" else band) and n == len(pop)
+                assert pct == pytest.approx(_percentile(pop, value), abs=1e-9)
+
+def test_reference_index_min_count_and_updates(tmp_path):
+    path = str(tmp_path / "r.idx")
+    assert main.ReferenceIndex(path).lookup(Sex.MALE, 30, 20.0) is None  # no file yet
+    main.update_reference(path, [("male", 30, 20.0)] * 29)
+    assert main.ReferenceIndex(path, min_count=30).lookup(Sex.MALE, 30, 20.0) is None
+    main.update_reference(path, [("male", 30, 10.0)])  # merged into what is there
+    ref = main.ReferenceIndex(path, min_count=30)
+    assert ref.lookup(Sex.MALE, 30, 20.0) == (pytest.approx(100 * (1 + 29 / 2) / 30), "30-39", 30)
+    assert ref.lookup(Sex.MALE, None, 10.0) == (pytest.approx(100 * 0.5 / 30), "all", 30)
+    assert ref.lookup(Sex.FEMALE, 30, 20.0) is None
+    assert main.update_reference(path, [("female", 30, 20.0)], rebuild=True) == (1, 1)
+    ref._check_at = 0.0  # a server notices the replaced file on its next check
+    assert ref.lookup(Sex.MALE, 30, 20.0) is None
+    assert sum(total for _, _, total in ref.groups.values()) == 2  # (female, 30-39) and (female, all)